@@ -20,9 +20,9 @@ app.conf.beat_schedule = {
         'task':'task.tasks.create_task_with_recurrence_rule',
         'schedule':crontab(hour=0, minute=0)
     },
-    'send_reminder_email':{
-        'task':'task.tasks.send_reminder_email',
-        'schedule':crontab(minute='*/3')
+    'dispatch_due_reminders':{
+        'task':'task.tasks.dispatch_due_reminders',
+        'schedule':5.0  # seconds, reminders are sent within seconds of their time
     },
     'check_tasks_expiration': {
         'task': 'task.tasks.check_tasks_expiration',
@@ -48,5 +48,17 @@ app.conf.beat_schedule = {
     'calculate_user_streak':{
         'task':'task.tasks.calculate_user_streak',
         'schedule':crontab(hour=0, minute=0)
+    },
+    'compact_sync_tombstones':{
+        'task':'task.tasks.compact_sync_tombstones',
+        'schedule':crontab(hour=3, minute=30)
+    },
+    'compute_windowed_leaderboards':{
+        'task':'user.tasks.compute_windowed_leaderboards',
+        'schedule':crontab(minute='*/10')
+    },
+    'rebuild_lost_leaderboards':{
+        'task':'user.tasks.rebuild_lost_leaderboards',
+        'schedule':60.0  # seconds, the view reads the user table until then
     }
 }
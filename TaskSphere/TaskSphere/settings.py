@@ -140,6 +140,9 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Serialize task lists from values() rows instead of model instances
+TASK_LIST_FAST_SERIALIZER = os.getenv('TASK_LIST_FAST_SERIALIZER', 'False') == 'True'
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=7),
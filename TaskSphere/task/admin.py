@@ -1,10 +1,23 @@
 from django.contrib import admin
 from .models import Task, Category, Tag, RecurrenceRule, SubTask
-    
+
 # Register your models here.
-admin.site.register(Task)
 admin.site.register(Category)
 admin.site.register(Tag)
 admin.site.register(SubTask)
 admin.site.register(RecurrenceRule)
 
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    readonly_fields = Task.COUNTER_FIELDS
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            # Leave the subtask counters to their F() updates
+            obj.save(update_fields=[
+                field.name for field in obj._meta.concrete_fields
+                if not field.primary_key and field.name not in Task.COUNTER_FIELDS
+            ])
+        else:
+            obj.save()
@@ -1,33 +1,396 @@
 """
 Utility functions for task caching management.
+
+Task list responses are cached under versioned per-user namespaces:
+every cached entry lives at a key built from the user ID, the user's
+current cache generation and a hash of the normalized filter parameters.
+Any task, subtask, tag or category write bumps the generation, which makes
+every previously cached variant unreachable at once (they simply expire
+through their TTL) instead of having to delete keys one by one.
+
+The generation also backs the HTTP validators (ETag / Last-Modified) of
+the task, profile and taxonomy read endpoints, so conditional requests can
+be answered with 304 without touching the database.
+
+Calendar density buckets are versioned per (user, month) instead, so a
+write only invalidates the months its tasks are due in.
 """
+import gzip
+import hashlib
+import json
+import time
+from decimal import Decimal
+
 from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_etags
 from django_redis import get_redis_connection
 
-from .serializers import TasksListSerializer
+
+TASK_LIST_CACHE_TIMEOUT = 60 * 5  # 5 minutes
+
+# Rendered bodies smaller than this are stored as-is, compressing them
+# saves less memory than it costs in CPU.
+TASK_LIST_COMPRESS_MIN_SIZE = 1024  # bytes
+TASK_LIST_COMPRESS_LEVEL = 6
+
+# Calendar density buckets only change when a task due in their month
+# changes, so they are kept much longer than task lists
+CALENDAR_DENSITY_CACHE_TIMEOUT = 60 * 60 * 24  # 1 day
+
+
+def _generation_key(user_id):
+    return f'tasks_generation_user_{user_id}'
+
+
+def _modified_key(user_id):
+    return f'tasks_modified_user_{user_id}'
+
+
+def _new_generation():
+    # Seed from the clock so a generation counter that was evicted never
+    # restarts at a value older cache entries could still be stored under.
+    return time.time_ns() // 1000
+
+
+def get_task_cache_generation(user_id):
+    """
+    Return the current task cache generation for a user,
+    creating it if it does not exist yet.
+    """
+    key = _generation_key(user_id)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, _new_generation(), timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+def get_task_cache_state(user_id):
+    """
+    Return the user's (generation, last_modified) pair in one round trip.
+    last_modified is the unix timestamp of the latest generation bump.
+    """
+    generation_key = _generation_key(user_id)
+    modified_key = _modified_key(user_id)
+    values = cache.get_many([generation_key, modified_key])
+
+    generation = values.get(generation_key)
+    if generation is None:
+        generation = get_task_cache_generation(user_id)
+
+    last_modified = values.get(modified_key)
+    if last_modified is None:
+        cache.add(modified_key, int(time.time()), timeout=None)
+        last_modified = cache.get(modified_key)
+
+    return generation, last_modified
+
+
+def bump_task_cache_generation(user_id):
+    """
+    Move the user to a new cache generation right away.
+    Prefer invalidate_user_task_cache() which defers this until commit.
+    """
+    key = _generation_key(user_id)
+    try:
+        generation = cache.incr(key)
+    except ValueError:
+        generation = _new_generation()
+        cache.set(key, generation, timeout=None)
+    cache.set(_modified_key(user_id), int(time.time()), timeout=None)
+    return generation
+
+
+class _GenerationBump:
+    """on_commit callback bumping the cache generation of one user."""
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+
+    def __call__(self):
+        bump_task_cache_generation(self.user_id)
 
 
 def invalidate_user_task_cache(user_id):
     """
     Invalidate all task list caches for a specific user.
-    Call this function whenever a task-related change occurs.
-    
+    Call this function whenever a task, subtask, tag or category changes.
+
+    Inside a transaction the generation bump is deferred with on_commit and
+    registered only once per user, no matter how many writes happen, so
+    readers never repopulate the cache with data that is about to change.
+
     Args:
         user_id: The ID of the user whose cache should be invalidated
     """
-    cache_keys = [
-        f'tasks_all_user_{user_id}',
-        f'tasks_active_user_{user_id}',
-        f'tasks_completed_user_{user_id}'
-    ]
-    cache.delete_many(cache_keys)
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        bump_task_cache_generation(user_id)
+        return
+
+    for _, callback, _ in connection.run_on_commit:
+        if isinstance(callback, _GenerationBump) and callback.user_id == user_id:
+            return
+    transaction.on_commit(_GenerationBump(user_id))
+
+
+def invalidate_task_cache_for_users(user_ids):
+    """
+    Invalidate the task list caches of several users.
+    Used by background jobs that touch tasks of many users at once.
+    """
+    for user_id in set(user_ids):
+        invalidate_user_task_cache(user_id)
+
+
+def get_due_month(due_date):
+    """Return the first day of the (local) month a due date falls in."""
+    return timezone.localtime(due_date).date().replace(day=1)
+
+
+def _density_version_key(user_id, month):
+    return f'calendar_density_version_user_{user_id}_{month:%Y-%m}'
+
+
+def get_calendar_density_versions(user_id, months):
+    """
+    Return {month: version} for the user's calendar density buckets,
+    creating missing versions. Fetched in one round trip.
+    """
+    keys = {month: _density_version_key(user_id, month) for month in months}
+    values = cache.get_many(keys.values())
+
+    versions = {}
+    for month, key in keys.items():
+        version = values.get(key)
+        if version is None:
+            cache.add(key, _new_generation(), timeout=None)
+            version = cache.get(key)
+        versions[month] = version
+    return versions
+
+
+def make_calendar_density_cache_key(user_id, month, version):
+    return f'calendar_density_user_{user_id}_{month:%Y-%m}_v{version}'
+
+
+def bump_calendar_density_versions(user_id, months):
+    """
+    Move the given months of a user to new versions right away.
+    Prefer invalidate_calendar_density() which defers this until commit.
+    """
+    for month in months:
+        key = _density_version_key(user_id, month)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_generation(), timeout=None)
+
+
+class _DensityBump:
+    """on_commit callback bumping the calendar density months of one user."""
+
+    def __init__(self, user_id, months):
+        self.user_id = user_id
+        self.months = set(months)
+
+    def __call__(self):
+        bump_calendar_density_versions(self.user_id, self.months)
+
+
+def invalidate_calendar_density(user_id, due_dates):
+    """
+    Invalidate the cached calendar density buckets of the months the
+    given due dates fall in. Pass the old and the new due date of an
+    updated task. Other months stay cached.
+
+    Like invalidate_user_task_cache(), the bump is deferred until commit
+    and registered once per user inside a transaction.
+
+    Args:
+        user_id: The ID of the user owning the tasks
+        due_dates: Due dates of the written tasks (None values are ignored)
+    """
+    months = {get_due_month(due_date) for due_date in due_dates if due_date is not None}
+    if not months:
+        return
+
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        bump_calendar_density_versions(user_id, months)
+        return
+
+    for _, callback, _ in connection.run_on_commit:
+        if isinstance(callback, _DensityBump) and callback.user_id == user_id:
+            callback.months.update(months)
+            return
+    transaction.on_commit(_DensityBump(user_id, months))
+
+
+def normalize_filter_params(filterset):
+    """
+    Turn a bound TaskFilter into a canonical dict of the filters in use.
+
+    Values come from the filter form's cleaned data, so equivalent query
+    strings (e.g. `is_completed=true` and `is_completed=True`, or a different
+    parameter order) map to the same cache entry, while unknown parameters
+    are ignored. Returns None if the filters do not validate.
+    """
+    if not filterset.form.is_valid():
+        return None
+
+    params = {}
+    for name, value in filterset.form.cleaned_data.items():
+        if value is None or value == '' or value == []:
+            continue
+        if isinstance(value, (list, tuple)):
+            value = [str(item) for item in value]
+        elif isinstance(value, Decimal):
+            value = str(value.normalize())
+        elif not isinstance(value, (bool, int)):
+            value = str(value)
+        params[name] = value
+    return params
+
+
+def get_task_list_window(user_id):
+    """
+    Return (window, window_start) of the user's current cache window.
+
+    Task lists contain the time dependent `is_overdue` flag, so each cached
+    variant (and its ETag) is only valid for one TASK_LIST_CACHE_TIMEOUT
+    window. Windows are offset per user so caches do not all roll over at
+    the same moment.
+    """
+    offset = user_id % TASK_LIST_CACHE_TIMEOUT
+    window = int((time.time() + offset) // TASK_LIST_CACHE_TIMEOUT)
+    return window, window * TASK_LIST_CACHE_TIMEOUT - offset
+
+
+def make_task_list_cache_key(user_id, params, generation=None):
+    """
+    Build the cache key for a task list variant of a user.
+
+    Args:
+        user_id: The ID of the user owning the list
+        params: Normalized parameters (see normalize_filter_params)
+        generation: The user's cache generation, looked up if not given
+    """
+    canonical = json.dumps(params, sort_keys=True, separators=(',', ':'))
+    digest = hashlib.sha1(canonical.encode()).hexdigest()
+    if generation is None:
+        generation = get_task_cache_generation(user_id)
+    window, _ = get_task_list_window(user_id)
+    return f'tasks_list_user_{user_id}_v{generation}_w{window}_{digest}'
+
+
+def make_etag(*parts):
+    """Build a strong ETag from the given version parts."""
+    return '"%s"' % hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+
+def _gzip_etag(etag):
+    # Strong ETags must differ between encodings of the same resource
+    return f'{etag[:-1]}-gzip"'
+
+
+def get_not_modified_response(request, etag, last_modified):
+    """
+    Answer a conditional GET from validators alone.
+
+    Returns a 304 response if the client's If-None-Match / If-Modified-Since
+    still match, None otherwise. Both the plain and the gzip variant of
+    the ETag are accepted.
+
+    Args:
+        request: The incoming request
+        etag: Current ETag of the resource
+        last_modified: Unix timestamp of the last change
+    """
+    if _gzip_etag(etag) in parse_etags(request.META.get('HTTP_IF_NONE_MATCH', '')):
+        etag = _gzip_etag(etag)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        patch_conditional_headers(response, etag, last_modified)
+    return response
+
+
+def patch_conditional_headers(response, etag, last_modified):
+    """
+    Add ETag, Last-Modified and Cache-Control headers to a response.
+    Responses are per user, so shared caches must not store them and
+    clients have to revalidate before reusing them.
+    """
+    if not response.has_header('ETag'):
+        response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def make_cached_response(body, content_type, etag):
+    """
+    Build the cache entry for a fully rendered response body.
+
+    The body is gzip-compressed once it reaches TASK_LIST_COMPRESS_MIN_SIZE.
+
+    Args:
+        body: Rendered response body (bytes)
+        content_type: Value of the response Content-Type header
+        etag: Strong ETag of the body (see make_etag)
+    """
+    entry = {
+        'content_type': content_type,
+        'etag': etag,
+        'compressed': False,
+        'body': body,
+    }
+    if len(body) >= TASK_LIST_COMPRESS_MIN_SIZE:
+        entry['compressed'] = True
+        entry['body'] = gzip.compress(body, compresslevel=TASK_LIST_COMPRESS_LEVEL, mtime=0)
+    return entry
+
+
+def _accepts_gzip(request):
+    accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    return 'gzip' in [part.split(';')[0].strip() for part in accept_encoding.split(',')]
+
+
+def build_cached_response(entry, request):
+    """
+    Turn a cache entry created by make_cached_response() into a response.
+
+    The stored bytes are sent back untouched, no serializer or renderer
+    runs. Compressed bodies go out with Content-Encoding: gzip when the
+    client accepts it and are only decompressed for clients that do not.
+    """
+    body = entry['body']
+    etag = entry['etag']
+    if entry['compressed'] and _accepts_gzip(request):
+        response = HttpResponse(body, content_type=entry['content_type'])
+        response['Content-Encoding'] = 'gzip'
+        etag = _gzip_etag(etag)
+    else:
+        if entry['compressed']:
+            body = gzip.decompress(body)
+        response = HttpResponse(body, content_type=entry['content_type'])
+
+    response['ETag'] = etag
+    if entry['compressed']:
+        patch_vary_headers(response, ('Accept-Encoding',))
+    return response
 
 
 def get_cache_stats():
     """
     Get cache statistics for monitoring performance.
     Useful for debugging and monitoring cache effectiveness.
-    
+
     Returns:
         dict: Cache statistics if available
     """
@@ -35,7 +398,7 @@ def get_cache_stats():
         # This works with django-redis
         redis_conn = get_redis_connection("default")
         info = redis_conn.info()
-        
+
         return {
             'hits': info.get('keyspace_hits', 0),
             'misses': info.get('keyspace_misses', 0),
@@ -47,30 +410,6 @@ def get_cache_stats():
         return {'error': str(e)}
 
 
-def warm_cache_for_user(user, task_queryset):
-    """
-    Pre-populate cache with task data for a user.
-    Useful after bulk operations or login.
-    
-    Args:
-        user: The user object
-        task_queryset: QuerySet of tasks (should already be filtered for the user)
-    """
-    
-    
-    # Get all tasks
-    all_tasks_data = TasksListSerializer(task_queryset, many=True).data
-    cache.set(f'tasks_all_user_{user.id}', all_tasks_data, timeout=300)
-    
-    # Get active tasks
-    active_tasks = [task for task in all_tasks_data if not task.get('is_completed')]
-    cache.set(f'tasks_active_user_{user.id}', active_tasks, timeout=300)
-    
-    # Get completed tasks
-    completed_tasks = [task for task in all_tasks_data if task.get('is_completed')]
-    cache.set(f'tasks_completed_user_{user.id}', completed_tasks, timeout=300)
-
-
 def clear_all_task_caches():
     """
     Clear all task-related caches.
@@ -78,15 +417,16 @@ def clear_all_task_caches():
     Useful for maintenance or after major data migrations.
     """
     try:
-        
-        redis_conn = get_redis_connection("default")
-        
         # Delete all keys matching task cache patterns
-        for pattern in ['tasks_all_user_*', 'tasks_active_user_*', 'tasks_completed_user_*']:
-            keys = redis_conn.keys(pattern)
-            if keys:
-                redis_conn.delete(*keys)
-        
+        for pattern in [
+            'tasks_list_user_*',
+            'tasks_generation_user_*',
+            'tasks_modified_user_*',
+            'calendar_density_user_*',
+            'calendar_density_version_user_*',
+        ]:
+            cache.delete_pattern(pattern)
+
         return True
     except Exception as e:
         return False
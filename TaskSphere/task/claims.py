@@ -0,0 +1,39 @@
+"""
+Claiming rows for background jobs that may run in parallel.
+
+A worker claims a chunk of rows by locking the ones no other worker holds
+(SELECT ... FOR UPDATE SKIP LOCKED) and marking them with one UPDATE in the
+same short transaction. The mark has to take the rows out of the claimed
+queryset (e.g. clearing a reminder, stamping today's date), so overlapping
+runs and parallel workers never pick up the same row twice.
+
+SQLite has no row locks. There the claiming transaction takes the database
+write lock before reading, which makes claims run one at a time.
+"""
+from django.db import connections, transaction
+
+
+def claim_rows(queryset, limit=None, **changes):
+    """
+    Claim up to `limit` rows of `queryset`, apply `changes` to them with a
+    single UPDATE and return the claimed objects as they were read.
+
+    Order the queryset to claim rows in a stable order.
+    """
+    model = queryset.model
+    connection = connections[queryset.db]
+
+    with transaction.atomic(using=queryset.db):
+        if connection.features.has_select_for_update_skip_locked:
+            queryset = queryset.select_for_update(skip_locked=True, of=('self',))
+        elif connection.vendor == 'sqlite':
+            # Writing (even nothing) takes SQLite's write lock until commit
+            with connection.cursor() as cursor:
+                table = connection.ops.quote_name(model._meta.db_table)
+                pk = connection.ops.quote_name(model._meta.pk.column)
+                cursor.execute(f'UPDATE {table} SET {pk} = {pk} WHERE 0')
+
+        rows = list(queryset[:limit] if limit else queryset)
+        if rows:
+            model._base_manager.using(queryset.db).filter(pk__in=[row.pk for row in rows]).update(**changes)
+    return rows
@@ -1,6 +1,7 @@
 import django_filters
 from django.db.models import Q
 from .models import Task
+from .search import search_tasks
 
 
 class TaskFilter(django_filters.FilterSet):
@@ -47,16 +48,14 @@ class TaskFilter(django_filters.FilterSet):
     
     def filter_search(self, queryset, name, value):
         """
-        Search tasks by title.
-        Returns tasks where title starts with the search value or contains it.
+        Full-text search on title and description.
+        Every word must match the start of a word, results are annotated
+        with their relevance (see task.search).
         """
         if not value:
             return queryset
         
-        # starts with OR contains the value
-        return queryset.filter(
-            Q(title__istartswith=value) | Q(title__icontains=value)
-        ).distinct()
+        return search_tasks(queryset, value)
     
     def filter_overdue(self, queryset, name, value):
         """
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from task.models import Task, SubTask
+from task.cache_utils import clear_all_task_caches
+
+
+class Command(BaseCommand):
+    help = 'Recompute Task.subtasks_total and Task.subtasks_completed from the SubTask table.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Number of task IDs updated per statement (default: 5000)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = Task.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+
+        subtasks = SubTask.objects.filter(parent_task=OuterRef('pk')).order_by().values('parent_task')
+        total = Coalesce(Subquery(subtasks.annotate(count=Count('id')).values('count')), 0)
+        completed = Coalesce(Subquery(subtasks.filter(is_completed=True).annotate(count=Count('id')).values('count')), 0)
+
+        updated = 0
+        # Walk the table in id ranges so each UPDATE only locks one chunk
+        for start in range(0, max_id + 1, batch_size):
+            with transaction.atomic():
+                updated += Task.objects.filter(
+                    id__gte=start,
+                    id__lt=start + batch_size,
+                ).update(subtasks_total=total, subtasks_completed=completed)
+
+        # Cached task lists embed the completion percentage
+        clear_all_task_caches()
+
+        self.stdout.write(self.style.SUCCESS(f'Recomputed subtask counters for {updated} tasks'))
@@ -0,0 +1,108 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from task.models import RecurrenceRule, Task
+
+
+def get_hot_queries(user_id):
+    """
+    The Task queries run by the list/calendar views, the profile and the
+    beat jobs, as (name, queryset) pairs.
+    """
+    now = timezone.now()
+    today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    week_ago = now - timedelta(days=7)
+
+    return [
+        ('list tasks', Task.objects.filter(
+            user_id=user_id, parent_recurring_task__isnull=True,
+        ).order_by('-created_at', '-id')[:51]),
+        ('list tasks by due date', Task.objects.filter(
+            user_id=user_id, parent_recurring_task__isnull=True,
+        ).order_by('due_date', 'id')[:51]),
+        ('calendar', Task.objects.filter(
+            user_id=user_id, due_date__gte=week_ago, due_date__lte=now, is_recurring=False,
+        ).order_by('due_date', 'id')[:51]),
+        ('rebuild_reminder_schedule', Task.objects.filter(
+            reminder__isnull=False, is_completed=False, expired=False,
+        ).values_list('id', 'reminder')),
+        ('check_tasks_expiration', Task.objects.filter(
+            is_completed=False, expired=False, due_date__isnull=False, due_date__lt=now,
+        )),
+        ('delete_old_expired_tasks', Task.objects.filter(
+            expired=True, is_completed=False, due_date__lt=now - timedelta(days=30),
+        )),
+        ('daily digest', Task.objects.filter(
+            user_id=user_id, is_completed=False,
+            due_date__gte=today_start, due_date__lt=today_start + timedelta(days=1),
+        )),
+        ('weekly report (completed)', Task.objects.filter(
+            user_id=user_id, is_completed=True, updated_at__gte=week_ago,
+        )),
+        ('weekly report (created)', Task.objects.filter(
+            user_id=user_id, created_at__gte=week_ago,
+        )),
+        ('profile completed count', Task.objects.filter(
+            user_id=user_id, is_completed=True,
+        )),
+        ('recurrence templates', Task.objects.filter(
+            recurrence_rule__next_occurance__lte=now, is_recurring=True, parent_recurring_task=None,
+        )),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'EXPLAIN the hot Task queries and fail if any of them falls back to a '
+        'sequential scan of the task table. Run it against a database seeded '
+        'with representative data (see task.tests.QueryPlanTests).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user-id',
+            type=int,
+            default=1,
+            help='User ID used in per-user queries (default: 1)',
+        )
+        parser.add_argument(
+            '--verbose-plans',
+            action='store_true',
+            help='Print every plan, not only the failing ones',
+        )
+
+    def handle(self, *args, **options):
+        table = Task._meta.db_table
+        failures = []
+
+        # Plans depend on the table statistics, refresh them first
+        with connection.cursor() as cursor:
+            for model in (Task, RecurrenceRule):
+                cursor.execute(f'ANALYZE {connection.ops.quote_name(model._meta.db_table)}')
+
+        for name, queryset in get_hot_queries(options['user_id']):
+            plan = queryset.explain()
+            if self.is_sequential_scan(plan, table):
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f'{name}: sequential scan'))
+                self.stdout.write(plan)
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{name}: index scan'))
+                if options['verbose_plans']:
+                    self.stdout.write(plan)
+
+        if failures:
+            raise CommandError(f'Sequential scan on {table} in: {", ".join(failures)}')
+
+    def is_sequential_scan(self, plan, table):
+        if connection.vendor == 'postgresql':
+            return f'Seq Scan on {table}' in plan
+        if connection.vendor == 'sqlite':
+            return any(
+                f'SCAN {table}' in line and 'USING' not in line
+                for line in plan.splitlines()
+            )
+        raise CommandError(f'Plan checks are not supported on {connection.vendor}')
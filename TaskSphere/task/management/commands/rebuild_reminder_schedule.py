@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from task.reminders import rebuild_reminder_schedule
+
+
+class Command(BaseCommand):
+    help = (
+        'Add every pending task reminder from the database to the Redis '
+        'reminder schedule. Safe to run at any time.'
+    )
+
+    def handle(self, *args, **options):
+        total = rebuild_reminder_schedule()
+        self.stdout.write(self.style.SUCCESS(f'{total} pending reminders scheduled'))
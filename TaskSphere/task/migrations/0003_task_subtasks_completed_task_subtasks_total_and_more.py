@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:51
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_subtask_counters(apps, schema_editor):
+    Task = apps.get_model('task', 'Task')
+    SubTask = apps.get_model('task', 'SubTask')
+
+    subtasks = SubTask.objects.filter(parent_task=OuterRef('pk')).order_by().values('parent_task')
+    Task.objects.update(
+        subtasks_total=Coalesce(Subquery(subtasks.annotate(count=Count('id')).values('count')), 0),
+        subtasks_completed=Coalesce(Subquery(subtasks.filter(is_completed=True).annotate(count=Count('id')).values('count')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0002_rename_status_subtask_is_completed_task_expired_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='subtasks_completed',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='task',
+            name='subtasks_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='task',
+            name='title',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.RunPython(backfill_subtask_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,76 @@
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    """
+    CREATE INDEX IF NOT EXISTS task_search_idx ON task_task USING gin (
+        to_tsvector('simple'::regconfig, coalesce(title, '') || ' ' || coalesce(description, ''))
+    )
+    """,
+]
+
+POSTGRES_BACKWARD = [
+    'DROP INDEX IF EXISTS task_search_idx',
+]
+
+# External content FTS5 table: only the index is stored, rows are read
+# from task_task and the triggers keep the index in sync. SQLite drops
+# triggers when a migration rebuilds task_task, re-run these statements
+# after any such migration.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS task_task_fts USING fts5(
+        title, description, content='task_task', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS task_task_fts_insert AFTER INSERT ON task_task BEGIN
+        INSERT INTO task_task_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS task_task_fts_delete AFTER DELETE ON task_task BEGIN
+        INSERT INTO task_task_fts(task_task_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS task_task_fts_update AFTER UPDATE OF title, description ON task_task BEGIN
+        INSERT INTO task_task_fts(task_task_fts, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO task_task_fts(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO task_task_fts(task_task_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER IF EXISTS task_task_fts_update',
+    'DROP TRIGGER IF EXISTS task_task_fts_delete',
+    'DROP TRIGGER IF EXISTS task_task_fts_insert',
+    'DROP TABLE IF EXISTS task_task_fts',
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        vendor_statements = statements.get(schema_editor.connection.vendor, [])
+        for statement in vendor_statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0004_task_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements({'postgresql': POSTGRES_FORWARD, 'sqlite': SQLITE_FORWARD}),
+            run_statements({'postgresql': POSTGRES_BACKWARD, 'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:09
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def detach_duplicate_instances(apps, schema_editor):
+    """
+    Earlier recurrence jobs could create the same occurrence twice. Keep
+    the completed (or else the oldest) copy as the instance and turn the
+    other copies into standalone tasks, so no user data is lost.
+    """
+    Task = apps.get_model('task', 'Task')
+    duplicates = Task.objects.filter(parent_recurring_task__isnull=False).values(
+        'parent_recurring_task', 'due_date',
+    ).annotate(copies=Count('id')).filter(copies__gt=1).order_by()
+
+    for duplicate in duplicates:
+        copies = Task.objects.filter(
+            parent_recurring_task=duplicate['parent_recurring_task'],
+            due_date=duplicate['due_date'],
+        ).order_by('-is_completed', 'id').values_list('id', flat=True)
+        Task.objects.filter(id__in=list(copies[1:])).update(parent_recurring_task=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0006_sync_change_log'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(detach_duplicate_instances, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='task',
+            constraint=models.UniqueConstraint(condition=models.Q(('parent_recurring_task__isnull', False)), fields=('parent_recurring_task', 'due_date'), name='task_recurring_instance_unique'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:13
+
+import importlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+search_index = importlib.import_module('task.migrations.0005_task_search_index')
+
+
+def recreate_sqlite_search_triggers(apps, schema_editor):
+    # Adding the column rebuilds task_task on SQLite, which drops the
+    # full-text search triggers created in 0005
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in search_index.SQLITE_FORWARD:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('task', '0007_recurring_instance_unique'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='task',
+            name='inherits_template',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(recreate_sqlite_search_triggers, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='SubTaskCompletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('subtask', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='completions', to='task.subtask')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='subtask_completions', to='task.task')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('task', 'subtask'), name='subtask_completion_unique')],
+            },
+        ),
+    ]
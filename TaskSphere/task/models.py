@@ -1,4 +1,5 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Q
 from django.contrib.auth import get_user_model
 from dateutil.relativedelta import relativedelta
 
@@ -32,7 +33,7 @@ class RecurrenceRule(models.Model):
 
     frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES)
     interval = models.PositiveIntegerField(default=1)
-    next_occurance = models.DateTimeField()
+    next_occurance = models.DateTimeField(db_index=True)
 
     def calculate_next_occurrence(self):
         """
@@ -48,6 +49,19 @@ class RecurrenceRule(models.Model):
         
         return self.next_occurance
 
+    def iter_occurrences(self, until):
+        """
+        Yield next_occurance and the occurrences that follow it, up to and
+        including `until`, stepping exactly like calculate_next_occurrence().
+        Nothing is saved.
+        """
+        rule = RecurrenceRule(frequency=self.frequency, interval=self.interval, next_occurance=self.next_occurance)
+        if rule.frequency not in ('daily', 'weekly', 'monthly') or rule.interval < 1:
+            return
+        while rule.next_occurance <= until:
+            yield rule.next_occurance
+            rule.calculate_next_occurrence()
+
 
 class Task(models.Model):
         
@@ -80,28 +94,118 @@ class Task(models.Model):
              blank=True,
              related_name='instances'
              )
+        # Denormalized subtask counters, kept in sync by SubTask
+        subtasks_total = models.PositiveIntegerField(default=0)
+        subtasks_completed = models.PositiveIntegerField(default=0)
+        # Recurring instances created by the recurrence job show their
+        # template's tags and subtasks instead of copies of them, until the
+        # instance is edited (see task.recurrence.detach_instances).
+        # Subtask completion of such instances lives in SubTaskCompletion.
+        inherits_template = models.BooleanField(default=False)
+
+        class Meta:
+            # One index per hot predicate: the list/calendar views, the digest,
+            # report and streak jobs and the beat jobs scanning for reminders
+            # and expired tasks. Partial indexes only cover the rows those
+            # jobs can ever match.
+            indexes = [
+                # ListTasksView (default ordering), weekly report
+                models.Index(fields=['user', '-created_at', '-id'], name='task_user_created_idx'),
+                # CalendarTasksView, ListTasksView ordered by due date, daily digests
+                models.Index(fields=['user', 'due_date', 'id'], name='task_user_due_idx'),
+                # Weekly report, streaks, profile statistics
+                models.Index(
+                    fields=['user', 'updated_at'],
+                    name='task_user_completed_idx',
+                    condition=Q(is_completed=True),
+                ),
+                # Rebuilding the reminder schedule (task.reminders)
+                models.Index(
+                    fields=['reminder'],
+                    name='task_pending_reminder_idx',
+                    condition=Q(reminder__isnull=False, is_completed=False, expired=False),
+                ),
+                # check_tasks_expiration
+                models.Index(
+                    fields=['due_date'],
+                    name='task_expiring_idx',
+                    condition=Q(due_date__isnull=False, is_completed=False, expired=False),
+                ),
+                # delete_old_expired_tasks
+                models.Index(
+                    fields=['due_date'],
+                    name='task_expired_idx',
+                    condition=Q(expired=True, is_completed=False),
+                ),
+            ]
+            constraints = [
+                # A recurring template is materialized once per occurrence,
+                # so re-running (or overlapping) recurrence jobs is harmless
+                models.UniqueConstraint(
+                    fields=['parent_recurring_task', 'due_date'],
+                    name='task_recurring_instance_unique',
+                    condition=Q(parent_recurring_task__isnull=False),
+                ),
+            ]
+
+        # Maintained with F() updates (SubTask, toggle_inherited_subtask), so
+        # writers of existing tasks must leave them out of update_fields
+        COUNTER_FIELDS = ('subtasks_total', 'subtasks_completed')
+
+        def get_template_source(self):
+            """
+            Task whose tags and subtasks this task shows: its recurring
+            template while it inherits them, otherwise the task itself.
+            """
+            if self.inherits_template and self.parent_recurring_task_id:
+                return self.parent_recurring_task
+            return self
+
+        def get_subtask_states(self):
+            """Return (subtask, is_completed) pairs, inherited subtasks included."""
+            source = self.get_template_source()
+            subtasks = source.subtasks.order_by('id')
+            if source is self:
+                return [(subtask, subtask.is_completed) for subtask in subtasks]
+            completed = set(self.subtask_completions.values_list('subtask_id', flat=True))
+            return [(subtask, subtask.id in completed) for subtask in subtasks]
+
+        def toggle_inherited_subtask(self, subtask):
+            """
+            Flip the completion of one of the template's subtasks on this
+            inheriting instance and update the instance's counter.
+            Returns the new state, or None if the subtask was changed by
+            someone else meanwhile.
+            """
+            completions = SubTaskCompletion.objects.filter(task=self, subtask=subtask)
+            if completions.exists():
+                if not completions.delete()[0]:
+                    return None
+                is_completed = False
+            else:
+                try:
+                    with transaction.atomic():
+                        SubTaskCompletion.objects.create(task=self, subtask=subtask)
+                except IntegrityError:
+                    return None
+                is_completed = True
+
+            Task.objects.filter(pk=self.pk).update(
+                subtasks_completed=F('subtasks_completed') + (1 if is_completed else -1)
+            )
+            return is_completed
 
         def calculate_subtasks_completion_percentage(self):
-            total_subtasks = self.subtasks.count()
-            
-            if total_subtasks == 0:
+            if self.subtasks_total == 0:
                 return 0
             
-            completed_subtasks = self.subtasks.filter(is_completed=True).count()
-            
-            return round((completed_subtasks / total_subtasks) * 100)
+            return round((self.subtasks_completed / self.subtasks_total) * 100)
 
         def check_all_subtasks_completion(self):
-            total_subtasks = self.subtasks.count()
-
-            if total_subtasks == 0:
+            if self.subtasks_total == 0:
                 return False
             
-            completed_subtasks = self.subtasks.filter(is_completed = True).count()
-
-            if completed_subtasks == total_subtasks:
-                return True
-            return False
+            return self.subtasks_completed == self.subtasks_total
         
         @property
         def is_overdue(self):
@@ -115,18 +219,146 @@ class Task(models.Model):
              return self.title
         
 
+def _move_subtask_counters(task_id, total, completed):
+     """Add `total` and `completed` (either may be negative) to a task's subtask counters."""
+     if total or completed:
+          Task.objects.filter(pk=task_id).update(
+               subtasks_total=F('subtasks_total') + total,
+               subtasks_completed=F('subtasks_completed') + completed,
+          )
+
+
+class SubTaskQuerySet(models.QuerySet):
+
+     def delete(self):
+          """
+          Delete the subtasks and take them off their tasks' counters, one
+          UPDATE per task. Deletes cascading from a Task skip this, their
+          counters go with the task.
+          """
+          with transaction.atomic(using=self.db):
+               removed = {}
+               for parent_task_id, is_completed in self.select_for_update().values_list('parent_task_id', 'is_completed'):
+                    total, completed = removed.get(parent_task_id, (0, 0))
+                    removed[parent_task_id] = (total + 1, completed + int(is_completed))
+               result = super().delete()
+               for parent_task_id, (total, completed) in removed.items():
+                    _move_subtask_counters(parent_task_id, -total, -completed)
+          return result
+
+
 class SubTask(models.Model):
      title = models.CharField(max_length=20)
      parent_task = models.ForeignKey(Task, related_name='subtasks', on_delete=models.CASCADE)
      is_completed = models.BooleanField(default=False)
 
+     objects = SubTaskQuerySet.as_manager()
+
+     def save(self, *args, **kwargs):
+          if self._state.adding:
+               super().save(*args, **kwargs)
+               _move_subtask_counters(self.parent_task_id, 1, int(self.is_completed))
+               return
+
+          # Move the counters by what this save changes compared with the
+          # stored row, which stays locked until the save commits
+          with transaction.atomic():
+               stored = SubTask.objects.select_for_update().filter(pk=self.pk).values_list(
+                    'parent_task_id', 'is_completed'
+               ).first()
+               super().save(*args, **kwargs)
+               if stored is None:
+                    return
+
+               old_task_id, was_completed = stored
+               update_fields = kwargs.get('update_fields')
+               task_id = self.parent_task_id if update_fields is None or 'parent_task' in update_fields else old_task_id
+               is_completed = self.is_completed if update_fields is None or 'is_completed' in update_fields else was_completed
+               if task_id != old_task_id:
+                    _move_subtask_counters(old_task_id, -1, -int(was_completed))
+                    _move_subtask_counters(task_id, 1, int(is_completed))
+               else:
+                    _move_subtask_counters(task_id, 0, int(is_completed) - int(was_completed))
+
+     def delete(self, *args, **kwargs):
+          # SubTaskQuerySet.delete reads the stored state under a lock
+          return SubTask.objects.filter(pk=self.pk).delete()
+
+     def toggle(self):
+          """
+          Flip the completion state and update the parent task's counter.
+          The flip is conditional on the state we read, so concurrent
+          toggles can not move the counter twice for the same change.
+          Returns False if the subtask was changed by someone else meanwhile.
+          """
+          was_completed = self.is_completed
+          updated = SubTask.objects.filter(pk=self.pk, is_completed=was_completed).update(
+               is_completed=not was_completed
+          )
+          if not updated:
+               return False
+
+          self.is_completed = not was_completed
+          Task.objects.filter(pk=self.parent_task_id).update(
+               subtasks_completed=F('subtasks_completed') + (1 if self.is_completed else -1)
+          )
+          return True
+
      def __str__(self):
           return f'{self.parent_task.title} - {self.title}'
-     
 
 
+class SubTaskCompletion(models.Model):
+    """
+    A template subtask completed on a recurring instance that inherits
+    it (see Task.inherits_template). Only completed subtasks have a row.
+    """
+    task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name='subtask_completions')
+    subtask = models.ForeignKey(SubTask, on_delete=models.CASCADE, related_name='completions')
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['task', 'subtask'], name='subtask_completion_unique'),
+        ]
 
+    def __str__(self):
+        return f'{self.task_id} - {self.subtask_id}'
 
 
+class SyncSequence(models.Model):
+    """Per-user counter numbering the changes of the delta sync log."""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='sync_sequence')
+    value = models.BigIntegerField(default=0)
 
+
+class SyncChange(models.Model):
+    """
+    Latest change of one task, subtask, tag or category, for delta sync.
+    There is one row per object, deleted objects keep theirs as a tombstone
+    until the compaction job expires it.
+    """
+    KIND_CHOICES = [
+        ('task', 'Task'),
+        ('subtask', 'Subtask'),
+        ('tag', 'Tag'),
+        ('category', 'Category'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_changes')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    seq = models.BigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'kind', 'object_id'], name='sync_change_object_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'seq'], name='sync_change_user_seq_idx'),
+            models.Index(fields=['changed_at'], name='sync_tombstone_idx', condition=Q(deleted=True)),
+        ]
+
+    def __str__(self):
+        return f'{self.kind} {self.object_id} @ {self.seq}'
@@ -0,0 +1,228 @@
+"""
+Keyset (cursor) pagination for task lists.
+"""
+import base64
+import json
+from collections.abc import Mapping
+from datetime import datetime
+
+from django.db.models import F, FloatField, Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+from .models import Task
+from .search import SEARCH_RANK
+
+
+class TaskKeysetPagination(BasePagination):
+    """
+    Paginate tasks by seeking past the last row of the previous page.
+
+    Rows are ordered by the active ordering followed by `id`, and the cursor
+    stores that ordering together with the sort values of the last row, so
+    the next page is a plain `WHERE (due_date, id) > (...)` style lookup and
+    deep pages cost the same as the first one. NULL values always sort last.
+
+    Search results are ordered by relevance unless an ordering is requested.
+    """
+    cursor_query_param = 'cursor'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
+    ordering = ('-created_at',)
+    invalid_cursor_message = 'Invalid cursor'
+    # Annotations rows may be ordered by, with their field types
+    annotated_fields = {SEARCH_RANK: FloatField()}
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        cursor = self.decode_cursor(request, view)
+        self.position = None
+        if cursor is None:
+            self.current_ordering = self.get_ordering(request, view, queryset)
+        else:
+            self.current_ordering, position = cursor
+            self.position = position
+            for field in self.current_ordering:
+                name = field.lstrip('-')
+                if name in self.annotated_fields and name not in queryset.query.annotations:
+                    raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(self.get_position_filter(self.current_ordering, position))
+
+        queryset = queryset.order_by(*self.get_order_by(self.current_ordering))
+
+        # The next cursor is built from the ordering fields of the last row,
+        # keep them loaded when the queryset was narrowed with only() or values()
+        ordering_fields = [field.lstrip('-') for field in self.current_ordering]
+        field_names, defer = queryset.query.deferred_loading
+        if queryset.query.values_select:
+            missing = [field for field in ordering_fields if field not in queryset.query.values_select]
+            if missing:
+                queryset = queryset.values(*queryset.query.values_select, *missing)
+        elif field_names and not defer:
+            model_fields = [field for field in ordering_fields if field not in self.annotated_fields]
+            queryset = queryset.only(*field_names, *model_fields)
+
+        results = list(queryset[:self.page_size + 1])
+        self.has_next = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_cache_params(self, request):
+        """Parameters that select the page, for building cache keys."""
+        return {
+            self.cursor_query_param: request.query_params.get(self.cursor_query_param, ''),
+            self.page_size_query_param: self.get_page_size(request),
+        }
+
+    def get_ordering_filter(self, view):
+        filterset_class = getattr(view, 'filterset_class', None)
+        return filterset_class.base_filters.get('ordering') if filterset_class else None
+
+    def get_ordering_fields(self, view):
+        """Model fields and annotations the pagination may order by."""
+        fields = {field.lstrip('-') for field in self.ordering}
+        fields.update(self.annotated_fields)
+        ordering_filter = self.get_ordering_filter(view)
+        if ordering_filter:
+            fields.update(ordering_filter.param_map.values())
+        return fields
+
+    def get_default_ordering(self, queryset):
+        if queryset is not None and SEARCH_RANK in queryset.query.annotations:
+            return [f'-{SEARCH_RANK}']
+        return list(self.ordering)
+
+    def get_ordering(self, request, view, queryset=None):
+        """
+        Map the `ordering` filter parameter (if the view's filterset has one)
+        to model fields, falling back to relevance for search results and
+        to the default ordering otherwise.
+        """
+        ordering_filter = self.get_ordering_filter(view)
+        value = request.query_params.get('ordering')
+        if not ordering_filter or not value:
+            return self.get_default_ordering(queryset)
+
+        ordering = []
+        for param in value.split(','):
+            param = param.strip()
+            descending = param.startswith('-')
+            field_name = ordering_filter.param_map.get(param.lstrip('-'))
+            if field_name:
+                ordering.append(f'-{field_name}' if descending else field_name)
+        return ordering or self.get_default_ordering(queryset)
+
+    def get_order_by(self, ordering):
+        order_by = []
+        for field in ordering:
+            expression = F(field.lstrip('-'))
+            if field.startswith('-'):
+                order_by.append(expression.desc(nulls_last=True))
+            else:
+                order_by.append(expression.asc(nulls_last=True))
+        order_by.append('-id' if ordering and ordering[0].startswith('-') else 'id')
+        return order_by
+
+    def get_position_filter(self, ordering, position):
+        """
+        Build the lexicographic "comes after `position`" condition:
+        (a > x) OR (a = x AND b > y) OR ... OR (a = x AND ... AND id > z).
+        """
+        *values, last_id = position
+        condition = Q(pk__in=[])
+        equal = Q()
+
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            if value is None:
+                # NULLs sort last, nothing comes after them but more NULLs
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            after = Q(**{f'{name}__{lookup}': value})
+            if self.get_field(name).null:
+                after |= Q(**{f'{name}__isnull': True})
+            condition |= equal & after
+            equal &= Q(**{name: value})
+
+        id_lookup = 'lt' if ordering and ordering[0].startswith('-') else 'gt'
+        return condition | (equal & Q(**{f'id__{id_lookup}': last_id}))
+
+    def get_field(self, name):
+        if name in self.annotated_fields:
+            return self.annotated_fields[name]
+        return Task._meta.get_field(name)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        if isinstance(last, Mapping):
+            # Rows of a values() queryset
+            values = [last[field.lstrip('-')] for field in self.current_ordering]
+            last_id = last['id']
+        else:
+            values = [getattr(last, field.lstrip('-')) for field in self.current_ordering]
+            last_id = last.pk
+        cursor = self.encode_cursor(self.current_ordering, values + [last_id])
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def encode_cursor(self, ordering, position):
+        payload = {
+            'o': ordering,
+            'p': [value.isoformat() if isinstance(value, datetime) else value for value in position],
+        }
+        data = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, request, view=None):
+        """
+        Return (ordering, position) from the cursor parameter, or None if
+        there is no cursor. Raises NotFound for malformed cursors.
+        """
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+
+        try:
+            data = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            payload = json.loads(data)
+            ordering = [str(field) for field in payload['o']]
+            position = list(payload['p'])
+            if len(position) != len(ordering) + 1:
+                raise ValueError('Cursor does not match its ordering')
+            if not {field.lstrip('-') for field in ordering} <= self.get_ordering_fields(view):
+                raise ValueError('Cursor orders by an unknown field')
+            for index, field in enumerate(ordering):
+                model_field = self.get_field(field.lstrip('-'))
+                if position[index] is not None:
+                    position[index] = model_field.to_python(position[index])
+            position[-1] = int(position[-1])
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+        return ordering, position
+
+
+class CalendarKeysetPagination(TaskKeysetPagination):
+    """Calendar pages are always ordered by due date."""
+    ordering = ('due_date',)
@@ -0,0 +1,228 @@
+"""
+Materialization of recurring tasks.
+
+A recurring template (is_recurring=True, no parent) gets one instance per
+occurrence of its RecurrenceRule, due on the occurrence's (UTC) day at the
+template's due time. Occurrences missed while the job did not run are
+caught up as long as they are less than RECURRENCE_CATCH_UP old, older
+instances would only be expired and cleaned up again.
+
+Instances are copy-on-write: they copy the template's own columns but
+inherit its tags and subtasks (Task.inherits_template), with per-instance
+subtask completion kept in SubTaskCompletion. Editing an instance first
+gives it copies of its own (detach_instances), so materializing an
+occurrence writes a single row.
+
+Templates are processed in batches of TEMPLATE_BATCH_SIZE, each one in its
+own short transaction: the batch's templates are locked with SKIP LOCKED,
+instances are inserted with bulk_create and the rules are moved past now
+with one bulk_update. The unique constraint on
+(parent_recurring_task, due_date) guarantees an occurrence is never
+materialized twice, so runs can be repeated or sharded by template id range
+across workers (see get_template_shards).
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+
+from .cache_utils import invalidate_calendar_density, invalidate_user_task_cache
+from .models import RecurrenceRule, SubTask, SubTaskCompletion, Task
+from .sync import TASK, record_changes
+
+
+RECURRENCE_CATCH_UP = timedelta(days=30)
+
+# Templates locked and materialized per transaction
+TEMPLATE_BATCH_SIZE = 500
+
+# Rows per INSERT statement
+INSERT_BATCH_SIZE = 1000
+
+# Width of the template id range handled by one worker task
+RECURRENCE_SHARD_SIZE = 10000
+
+
+def get_due_templates(now):
+    """Recurring templates with an occurrence due by `now`."""
+    return Task.objects.filter(
+        recurrence_rule__next_occurance__lte=now,
+        is_recurring=True,
+        parent_recurring_task=None,
+    )
+
+
+def get_template_shards(now=None, shard_size=RECURRENCE_SHARD_SIZE):
+    """Split the ids of the due templates into (min_id, max_id) ranges."""
+    bounds = get_due_templates(now or timezone.now()).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return []
+    return [
+        (low, min(low + shard_size - 1, bounds['high']))
+        for low in range(bounds['low'], bounds['high'] + 1, shard_size)
+    ]
+
+
+def get_occurrence_due_date(template, occurrence):
+    """
+    Due date of the instance of `template` for one occurrence: the
+    occurrence's UTC day at the template's due time, or the occurrence
+    itself for templates without a due date.
+    """
+    if template.due_date is None:
+        return occurrence.replace(second=0, microsecond=0)
+    due_time = template.due_date.astimezone(dt_timezone.utc).timetz().replace(second=0, microsecond=0)
+    return datetime.combine(occurrence.astimezone(dt_timezone.utc).date(), due_time)
+
+
+def materialize_recurring_tasks(now=None, min_template_id=None, max_template_id=None):
+    """
+    Create the missing instances of every template due by `now`, optionally
+    limited to template ids between min_template_id and max_template_id.
+    Templates locked by another worker are skipped.
+
+    Returns the number of instances created.
+    """
+    now = now or timezone.now()
+    templates = get_due_templates(now).order_by('id')
+    if min_template_id is not None:
+        templates = templates.filter(id__gte=min_template_id)
+    if max_template_id is not None:
+        templates = templates.filter(id__lte=max_template_id)
+
+    templates = templates.select_related('recurrence_rule')
+
+    created = 0
+    last_id = None
+    while True:
+        batch = templates if last_id is None else templates.filter(id__gt=last_id)
+        with transaction.atomic():
+            batch = list(batch.select_for_update(skip_locked=True, of=('self',))[:TEMPLATE_BATCH_SIZE])
+            if not batch:
+                return created
+            created += _materialize_batch(batch, now)
+        last_id = batch[-1].id
+
+
+def _materialize_batch(templates, now):
+    catch_up_start = now - RECURRENCE_CATCH_UP
+    templates_by_id = {template.id: template for template in templates}
+
+    instances = {}
+    rules = []
+    for template in templates:
+        rule = template.recurrence_rule
+        occurrences = list(rule.iter_occurrences(now))
+        if not occurrences:
+            continue
+        rule.next_occurance = occurrences[-1]
+        rule.calculate_next_occurrence()
+        rules.append(rule)
+
+        for occurrence in occurrences:
+            if occurrence < catch_up_start:
+                continue
+            due_date = get_occurrence_due_date(template, occurrence)
+            instances[(template.id, due_date)] = Task(
+                user_id=template.user_id,
+                title=template.title,
+                description=template.description,
+                is_completed=False,
+                priority=template.priority,
+                due_date=due_date,
+                is_recurring=False,
+                category_id=template.category_id,
+                parent_recurring_task=template,
+                inherits_template=True,
+                subtasks_total=template.subtasks_total,
+            )
+
+    # Instances created by an earlier run
+    if instances:
+        due_dates = [due_date for _, due_date in instances]
+        existing = Task.objects.filter(
+            parent_recurring_task__in=templates_by_id,
+            due_date__gte=min(due_dates),
+            due_date__lte=max(due_dates),
+        ).values_list('parent_recurring_task_id', 'due_date')
+        for key in existing:
+            instances.pop(key, None)
+    instances = list(instances.values())
+
+    Task.objects.bulk_create(instances, batch_size=INSERT_BATCH_SIZE)
+    RecurrenceRule.objects.bulk_update(rules, ['next_occurance'], batch_size=INSERT_BATCH_SIZE)
+
+    task_ids = defaultdict(list)
+    due_dates = defaultdict(list)
+    for instance in instances:
+        task_ids[instance.user_id].append(instance.id)
+        due_dates[instance.user_id].append(instance.due_date)
+
+    for user_id in task_ids:
+        record_changes(user_id, TASK, task_ids[user_id])
+        invalidate_user_task_cache(user_id)
+        invalidate_calendar_density(user_id, due_dates[user_id])
+    return len(instances)
+
+
+def get_inheriting_instance_ids(template_ids):
+    """IDs of the instances showing the tags and subtasks of these templates."""
+    return list(Task.objects.filter(
+        parent_recurring_task__in=template_ids,
+        inherits_template=True,
+    ).values_list('id', flat=True))
+
+
+def detach_instances(tasks):
+    """
+    Copy on write: give the inheriting instances among `tasks` their own
+    copies of their template's tag links and subtasks, keeping each
+    instance's subtask completion. Call it before editing the instances,
+    inside the editing transaction. The given objects are updated in place.
+
+    Returns the created subtasks.
+    """
+    tasks = [task for task in tasks if task.inherits_template]
+    if not tasks:
+        return []
+
+    template_ids = {task.parent_recurring_task_id for task in tasks}
+    template_tags = defaultdict(list)
+    for template_id, tag_id in Task.tags.through.objects.filter(
+        task_id__in=template_ids,
+    ).values_list('task_id', 'tag_id'):
+        template_tags[template_id].append(tag_id)
+    template_subtasks = defaultdict(list)
+    for subtask in SubTask.objects.filter(parent_task_id__in=template_ids).only('id', 'title', 'parent_task_id').order_by('id'):
+        template_subtasks[subtask.parent_task_id].append(subtask)
+    completions = SubTaskCompletion.objects.filter(task__in=tasks)
+    completed = set(completions.values_list('task_id', 'subtask_id'))
+
+    through = Task.tags.through
+    through.objects.bulk_create(
+        [
+            through(task_id=task.id, tag_id=tag_id)
+            for task in tasks
+            for tag_id in template_tags[task.parent_recurring_task_id]
+        ],
+        batch_size=INSERT_BATCH_SIZE,
+    )
+
+    subtasks = []
+    for task in tasks:
+        copies = [
+            SubTask(parent_task=task, title=subtask.title, is_completed=(task.id, subtask.id) in completed)
+            for subtask in template_subtasks[task.parent_recurring_task_id]
+        ]
+        # bulk_create skips SubTask.save(), set the counters directly
+        task.subtasks_total = len(copies)
+        task.subtasks_completed = sum(copy.is_completed for copy in copies)
+        task.inherits_template = False
+        subtasks += copies
+    SubTask.objects.bulk_create(subtasks, batch_size=INSERT_BATCH_SIZE)
+
+    completions.delete()
+    Task.objects.bulk_update(tasks, ['inherits_template', 'subtasks_total', 'subtasks_completed'])
+    return subtasks
@@ -0,0 +1,165 @@
+"""
+Reminder schedule.
+
+Pending reminders are kept in a Redis sorted set (REMINDER_SCHEDULE_KEY):
+members are task IDs, scores the reminder's unix timestamp. Task writes
+update it once they commit (schedule_reminders) and the
+dispatch_due_reminders job, which runs every few seconds, pops the due
+entries in batches and queues their emails, so nothing scans the task
+table for reminders.
+
+Popped entries are moved to a second sorted set (REMINDER_INFLIGHT_KEY),
+scored with a deadline, until the sender is done with them. Entries whose
+deadline passed (the send job was never queued, or its worker died) are
+put back on the schedule by the next dispatch.
+
+The database stays the source of truth. The schedule can be rebuilt from
+it at any time (rebuild_reminder_schedule, or the rebuild_reminder_schedule
+command) and is rebuilt automatically if Redis lost it. Entries may be
+stale, the sender re-checks every task before sending.
+"""
+from django.db import transaction
+from django_redis import get_redis_connection
+
+from .models import Task
+
+
+REMINDER_SCHEDULE_KEY = 'tasks:reminder_schedule'
+
+# Present while the schedule holds every pending reminder
+REMINDER_SCHEDULE_BUILT_KEY = 'tasks:reminder_schedule:built'
+
+# Popped reminders whose send job has not finished yet
+REMINDER_INFLIGHT_KEY = 'tasks:reminder_schedule:inflight'
+
+# Reminders popped from the schedule per send job
+REMINDER_BATCH_SIZE = 100
+
+# Seconds a send job has to finish before its reminders are rescheduled
+REMINDER_INFLIGHT_TIMEOUT = 300
+
+# Seconds before a reminder whose email failed is tried again
+REMINDER_RETRY_DELAY = 60
+
+
+def get_pending_reminders():
+    """Tasks whose reminder has not been sent yet."""
+    return Task.objects.filter(reminder__isnull=False, is_completed=False, expired=False)
+
+
+def _update_schedule(scheduled, removed):
+    pipeline = get_redis_connection('default').pipeline()
+    if scheduled:
+        pipeline.zadd(REMINDER_SCHEDULE_KEY, scheduled)
+    if removed:
+        pipeline.zrem(REMINDER_SCHEDULE_KEY, *removed)
+    pipeline.execute()
+
+
+def schedule_reminders(tasks):
+    """
+    Add the reminders of the given tasks to the schedule, or remove the
+    tasks that no longer have a pending reminder, once the current
+    transaction commits.
+    """
+    scheduled = {}
+    removed = []
+    for task in tasks:
+        if task.reminder and not task.is_completed and not task.expired:
+            scheduled[str(task.id)] = task.reminder.timestamp()
+        else:
+            removed.append(str(task.id))
+    if scheduled or removed:
+        transaction.on_commit(lambda: _update_schedule(scheduled, removed))
+
+
+def restore_reminders(tasks, retry_at):
+    """
+    Give claimed reminders that could not be sent back to their tasks, as
+    read before the claim, and schedule them again at `retry_at`. Tasks
+    that got a new reminder meanwhile keep it.
+    """
+    scheduled = {}
+    for task in tasks:
+        if Task.objects.filter(pk=task.pk, reminder=None).update(reminder=task.reminder):
+            scheduled[str(task.pk)] = retry_at.timestamp()
+    if scheduled:
+        transaction.on_commit(lambda: _update_schedule(scheduled, []))
+
+
+def pop_due_reminders(now, limit=REMINDER_BATCH_SIZE):
+    """
+    Move up to `limit` reminders due by `now` from the schedule to the
+    in-flight set and return their task IDs. Each entry is returned to one
+    caller only, even when several dispatchers run at once. Call
+    acknowledge_reminders once they are handled.
+    """
+    redis = get_redis_connection('default')
+    members = redis.zrangebyscore(REMINDER_SCHEDULE_KEY, '-inf', now.timestamp(), start=0, num=limit)
+    if not members:
+        return []
+
+    # One MULTI, so an entry never leaves the schedule without being in flight
+    deadline = now.timestamp() + REMINDER_INFLIGHT_TIMEOUT
+    pipeline = redis.pipeline()
+    for member in members:
+        pipeline.zrem(REMINDER_SCHEDULE_KEY, member)
+    pipeline.zadd(REMINDER_INFLIGHT_KEY, {member: deadline for member in members})
+    removed = pipeline.execute()[:-1]
+    return [int(member) for member, was_removed in zip(members, removed) if was_removed]
+
+
+def acknowledge_reminders(task_ids):
+    """Drop reminders the sender is done with from the in-flight set."""
+    if task_ids:
+        get_redis_connection('default').zrem(REMINDER_INFLIGHT_KEY, *[str(task_id) for task_id in task_ids])
+
+
+def requeue_stalled_reminders(now):
+    """
+    Put the in-flight reminders whose deadline passed back on the schedule,
+    due at once. Entries rescheduled meanwhile keep their new time.
+    Returns the number of reminders.
+    """
+    redis = get_redis_connection('default')
+    members = redis.zrangebyscore(REMINDER_INFLIGHT_KEY, '-inf', now.timestamp())
+    if not members:
+        return 0
+
+    pipeline = redis.pipeline()
+    pipeline.zadd(REMINDER_SCHEDULE_KEY, {member: now.timestamp() for member in members}, nx=True)
+    pipeline.zrem(REMINDER_INFLIGHT_KEY, *members)
+    pipeline.execute()
+    return len(members)
+
+
+def rebuild_reminder_schedule(chunk_size=5000):
+    """
+    Add every pending reminder of the database to the schedule.
+
+    Entries that are already scheduled are left alone, so writes that
+    happen during a rebuild are never overwritten by older values.
+    Returns the number of pending reminders.
+    """
+    redis = get_redis_connection('default')
+    total = 0
+    batch = {}
+    pending = get_pending_reminders().values_list('id', 'reminder')
+    for task_id, reminder in pending.iterator(chunk_size=chunk_size):
+        batch[str(task_id)] = reminder.timestamp()
+        if len(batch) >= chunk_size:
+            redis.zadd(REMINDER_SCHEDULE_KEY, batch, nx=True)
+            total += len(batch)
+            batch = {}
+    if batch:
+        redis.zadd(REMINDER_SCHEDULE_KEY, batch, nx=True)
+        total += len(batch)
+
+    redis.set(REMINDER_SCHEDULE_BUILT_KEY, 1)
+    return total
+
+
+def ensure_reminder_schedule():
+    """Rebuild the schedule if Redis lost it (e.g. after a flush)."""
+    if not get_redis_connection('default').exists(REMINDER_SCHEDULE_BUILT_KEY):
+        rebuild_reminder_schedule()
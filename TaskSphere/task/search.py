@@ -0,0 +1,94 @@
+"""
+Full-text search over task titles and descriptions.
+
+Search is served by an index on every backend we deploy to:
+
+- PostgreSQL: a GIN index on the `tsvector` of title and description,
+  queried with prefix `tsquery` terms and ranked with ts_rank.
+- SQLite: the `task_task_fts` FTS5 shadow table, kept in sync with
+  task_task by triggers and ranked with bm25.
+
+Every word of the search value has to match the start of a word in the
+title or description. Matching tasks are annotated with SEARCH_RANK
+(higher is more relevant), which TaskKeysetPagination orders by when no
+explicit ordering is requested. See migration 0005 for the index DDL.
+"""
+import re
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+
+SEARCH_RANK = 'search_rank'
+
+FTS_TABLE = 'task_task_fts'
+
+# Same expression as the task_search_idx index, so the planner can use it
+_PG_VECTOR = (
+    "to_tsvector('simple'::regconfig, "
+    "coalesce({table}.title, '') || ' ' || coalesce({table}.description, ''))"
+)
+
+_WORD_RE = re.compile(r'\w+')
+
+
+def get_search_terms(value):
+    """Split a search value into lowercase words."""
+    return _WORD_RE.findall(value.lower())
+
+
+def _postgres_search(queryset, terms):
+    vector = _PG_VECTOR.format(table='"task_task"')
+    tsquery = ' & '.join(f'{term}:*' for term in terms)
+    return queryset.annotate(**{
+        SEARCH_RANK: RawSQL(
+            f"ts_rank({vector}, to_tsquery('simple', %s))::float8",
+            [tsquery],
+            output_field=FloatField(),
+        ),
+    }).filter(RawSQL(
+        f"{vector} @@ to_tsquery('simple', %s)",
+        [tsquery],
+        output_field=BooleanField(),
+    ))
+
+
+def _sqlite_search(queryset, terms):
+    match = ' '.join(f'"{term}"*' for term in terms)
+    # bm25() is lower for better matches, negate it so higher is better
+    return queryset.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]),
+    ).annotate(**{
+        SEARCH_RANK: RawSQL(
+            f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+            f'WHERE {FTS_TABLE} MATCH %s AND rowid = "task_task"."id"',
+            [match],
+            output_field=FloatField(),
+        ),
+    })
+
+
+def search_tasks(queryset, value):
+    """
+    Filter a Task queryset down to the tasks matching the search value,
+    annotated with their SEARCH_RANK.
+
+    Values without any word characters fall back to a plain substring
+    match on the title.
+    """
+    terms = get_search_terms(value)
+    if not terms:
+        return queryset.filter(title__icontains=value.strip())
+
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        return _postgres_search(queryset, terms)
+    if vendor == 'sqlite':
+        return _sqlite_search(queryset, terms)
+
+    # No search index on other backends, match substrings without ranking
+    condition = Q()
+    for term in terms:
+        condition &= Q(title__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition)
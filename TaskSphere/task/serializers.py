@@ -1,5 +1,13 @@
+from operator import itemgetter
+
+from django.db import transaction
 from rest_framework import serializers
+from rest_framework.relations import MANY_RELATION_KWARGS
+from rest_framework.settings import api_settings
+from rest_framework.utils.serializer_helpers import ReturnList
 from .models import Task, RecurrenceRule, SubTask, Category, Tag
+from .reminders import schedule_reminders
+from .sparse_fields import SparseFieldsetMixin, get_only_columns
 from django.utils import timezone
 
 
@@ -28,9 +36,69 @@ class SubtaskSerializer(serializers.ModelSerializer):
         fields = ('__all__')
 
 
+class OwnedManyRelatedField(serializers.ManyRelatedField):
+    """Resolve all primary keys of a many relation with one IN query."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+
+        child = self.child_relation
+        pks = []
+        for pk in data:
+            try:
+                pks.append(int(pk))
+            except (TypeError, ValueError):
+                child.fail('incorrect_type', data_type=type(pk).__name__)
+        pks = list(dict.fromkeys(pks))
+
+        objects = child.get_queryset().in_bulk(pks)
+        missing = [str(pk) for pk in pks if pk not in objects]
+        if missing:
+            raise serializers.ValidationError(child.missing_message.format(ids=', '.join(missing)))
+        return [objects[pk] for pk in pks]
+
+
+class OwnedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    Primary key relation limited to objects owned by the requesting user,
+    so ownership is checked by the lookup itself.
+    """
+    missing_message = 'Do not exist or do not belong to you: {ids}'
+
+    def __init__(self, **kwargs):
+        self.missing_message = kwargs.pop('missing_message', self.missing_message)
+        super().__init__(**kwargs)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(owner=self.context['request'].user)
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return OwnedManyRelatedField(**list_kwargs)
+
+
 class CreateTaskSerializer(serializers.ModelSerializer):
     recurrence_rule = RecurrenceRuleSerializer(required=False)
     subtasks = CreateSubTaskSerializer(many=True, required=False)
+    category = OwnedPrimaryKeyRelatedField(
+        queryset=Category.objects.all(),
+        required=False,
+        allow_null=True,
+        error_messages={'does_not_exist': 'Category does not exist or does not belong to you'},
+    )
+    tags = OwnedPrimaryKeyRelatedField(
+        queryset=Tag.objects.all(),
+        many=True,
+        required=False,
+        missing_message='Tags {ids} do not exist or do not belong to you',
+    )
     class Meta:
         model = Task
         fields = ('title', 'description', 'priority', 'due_date', 'category', 'tags', 'recurrence_rule', 'is_recurring', 'subtasks', 'reminder')
@@ -48,58 +116,59 @@ class CreateTaskSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('Task name too short! Must be atleast 3 characters long')
         return value
     
-    def validate_category(self, value):
-        if value:
-            user = self.context['request'].user
-            if not Category.objects.filter(id=value.id, owner=user).exists():
-                raise serializers.ValidationError('Category does not exist or does not belong to you')
-        return value
-    
-    def validate_reminder(self,value):
-        if value > self.due_date:
-            raise serializers.ValidationError('Reminder can not be after due date!')
-        return value
-    
-    def validate_tags(self, value):
-        if value:
-            user = self.context['request'].user
-            for tag in value:
-                if not Tag.objects.filter(id=tag.id, owner=user).exists():
-                    raise serializers.ValidationError(f'Tag "{tag.name}" does not exist or does not belong to you')
-        return value
-        
+    def validate(self, attrs):
+        # Category and tag ownership is checked by their fields' querysets
+        reminder = attrs.get('reminder')
+        due_date = attrs.get('due_date', self.instance.due_date if self.instance else None)
+        if reminder and due_date and reminder > due_date:
+            raise serializers.ValidationError({'reminder': 'Reminder can not be after due date!'})
+        return attrs
+
+    @transaction.atomic(savepoint=False)
     def create(self, validated_data):
 
         user = self.context['request'].user
         recurrence_data = validated_data.pop('recurrence_rule', None)
         subtasks_data = validated_data.pop('subtasks', [])
-        task = Task.objects.create(user=user, **validated_data)
+        tags = validated_data.pop('tags', [])
 
+        # Attach the recurrence rule before inserting, so the task is saved once
         if recurrence_data:
-            if task.due_date:
-                next_midnight = task.due_date.replace(
+            due_date = validated_data.get('due_date')
+            if due_date:
+                next_midnight = due_date.replace(
                     hour=0,
                     minute=0,
                     second=0,
                     microsecond=0
                 )
                 recurrence_data['next_occurance'] = next_midnight
-            recurrence = RecurrenceRule.objects.create(**recurrence_data)
-            task.recurrence_rule = recurrence
-            task.save()
+            validated_data['recurrence_rule'] = RecurrenceRule.objects.create(**recurrence_data)
 
-        # Create multiple subtasks
-        for subtask_data in subtasks_data:
-            SubTask.objects.create(
+        # bulk_create skips SubTask.save(), so set the counter up front
+        task = Task.objects.create(user=user, subtasks_total=len(subtasks_data), **validated_data)
+
+        # A new task has no tags yet, insert the links directly
+        Task.tags.through.objects.bulk_create([
+            Task.tags.through(task=task, tag=tag)
+            for tag in tags
+        ])
+
+        SubTask.objects.bulk_create([
+            SubTask(
                 title=subtask_data['title'],
                 parent_task=task,
                 is_completed=False
             )
+            for subtask_data in subtasks_data
+        ])
 
+        schedule_reminders([task])
         return task
 
     def update(self, instance, validated_data):
         recurrence_data = validated_data.pop('recurrence_rule', None)
+        tags = validated_data.pop('tags', None)
         
         if recurrence_data:
             if instance.recurrence_rule:
@@ -114,15 +183,36 @@ class CreateTaskSerializer(serializers.ModelSerializer):
         
         for key, value in validated_data.items():
             setattr(instance, key, value)
-        instance.save()
+        # Only the edited columns, the subtask counters may have moved meanwhile
+        instance.save(update_fields=[*validated_data, 'recurrence_rule', 'updated_at'])
+
+        if tags is not None:
+            instance.tags.set(tags)
         
         return instance
 
 
-class TasksListSerializer(serializers.ModelSerializer):
+class TasksListSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     subtasks_completion_percentage = serializers.SerializerMethodField()
     is_overdue = serializers.BooleanField(read_only=True)
+    tags = serializers.SerializerMethodField()
+
+    # Columns each field reads, used to narrow queries for sparse fieldsets
+    field_columns = {
+        'id': ('id',),
+        'title': ('title',),
+        'priority': ('priority',),
+        'due_date': ('due_date',),
+        'category': ('category',),
+        'tags': ('inherits_template', 'parent_recurring_task'),
+        'created_at': ('created_at',),
+        'updated_at': ('updated_at',),
+        'subtasks_completion_percentage': ('subtasks_total', 'subtasks_completed'),
+        'is_completed': ('is_completed',),
+        'description': ('description',),
+        'is_overdue': ('due_date', 'is_completed'),
+    }
 
     class Meta:
         model = Task
@@ -132,12 +222,131 @@ class TasksListSerializer(serializers.ModelSerializer):
     def get_subtasks_completion_percentage(self, obj):
         return obj.calculate_subtasks_completion_percentage()
 
+    def get_tags(self, obj):
+        # Recurring instances may show their template's tags
+        return [tag.pk for tag in obj.get_template_source().tags.all()]
+
+
+class TasksListFastSerializer:
+    """
+    Opt-in fast path for TasksListSerializer(many=True) on large lists.
+
+    Rows come from `Task.objects.values(*get_columns())` instead of model
+    instances, the tag IDs of all rows are loaded with one query and
+    `is_overdue` is evaluated against a single `now`, so none of the per-row,
+    per-field DRF machinery runs. The output is identical to
+    TasksListSerializer, sparse fieldsets included.
+    """
+    Meta = TasksListSerializer.Meta
+    field_columns = TasksListSerializer.field_columns
+
+    def __init__(self, instance=None, many=True, context=None, **kwargs):
+        self.instance = instance
+        self.context = context or {}
+
+    @classmethod
+    def get_columns(cls, sparse_fields=None):
+        """Columns to pass to values() for the given sparse fieldset."""
+        if sparse_fields is None:
+            sparse_fields = cls.Meta.fields
+        return get_only_columns(sparse_fields, cls.field_columns)
+
+    @staticmethod
+    def _datetime_formatter():
+        field = serializers.DateTimeField()
+        if getattr(field, 'format', api_settings.DATETIME_FORMAT) != 'iso-8601':
+            return field.to_representation
+
+        field_timezone = field.default_timezone()
+
+        def to_representation(value):
+            # Same as DateTimeField.to_representation for aware ISO 8601 output
+            if not value:
+                return None
+            if field_timezone is None:
+                return field.to_representation(value)
+            value = value.astimezone(field_timezone).isoformat()
+            if value.endswith('+00:00'):
+                value = value[:-6] + 'Z'
+            return value
+
+        return to_representation
+
+    @staticmethod
+    def _get_tag_source(row):
+        # Same as Task.get_template_source()
+        if row['inherits_template'] and row['parent_recurring_task']:
+            return row['parent_recurring_task']
+        return row['id']
+
+    def _get_tag_ids(self, rows):
+        """Return {task_id: tag_ids} of the tasks whose tags the rows show."""
+        source_ids = {self._get_tag_source(row) for row in rows}
+        tag_ids = {}
+        through = Task.tags.through.objects.filter(
+            task_id__in=source_ids
+        ).order_by('tag_id').values_list('task_id', 'tag_id')
+        for task_id, tag_id in through:
+            tag_ids.setdefault(task_id, []).append(tag_id)
+        return tag_ids
+
+    def to_representation(self, rows):
+        sparse_fields = self.context.get('sparse_fields')
+        fields = [name for name in self.Meta.fields if sparse_fields is None or name in sparse_fields]
+        rows = list(rows)
+        tag_ids = self._get_tag_ids(rows) if 'tags' in fields and rows else {}
+        to_datetime = self._datetime_formatter()
+        now = timezone.now()
+
+        def completion_percentage(row):
+            if row['subtasks_total'] == 0:
+                return 0
+            return round((row['subtasks_completed'] / row['subtasks_total']) * 100)
+
+        def is_overdue(row):
+            return row['due_date'] is not None and not row['is_completed'] and now > row['due_date']
+
+        getters = {
+            'id': itemgetter('id'),
+            'title': itemgetter('title'),
+            'priority': itemgetter('priority'),
+            'due_date': lambda row: to_datetime(row['due_date']),
+            'category': itemgetter('category'),
+            'tags': lambda row: tag_ids.get(self._get_tag_source(row), []),
+            'created_at': lambda row: to_datetime(row['created_at']),
+            'updated_at': lambda row: to_datetime(row['updated_at']),
+            'subtasks_completion_percentage': completion_percentage,
+            'is_completed': itemgetter('is_completed'),
+            'description': itemgetter('description'),
+            'is_overdue': is_overdue,
+        }
+        selected = [(name, getters[name]) for name in fields]
+        return [{name: getter(row) for name, getter in selected} for row in rows]
+
+    @property
+    def data(self):
+        return ReturnList(self.to_representation(self.instance), serializer=self)
+
 
 class TaskDetailSerializer(serializers.ModelSerializer):
+    tags = serializers.SerializerMethodField()
+    subtasks = serializers.SerializerMethodField()
+
     class Meta:
         model = Task
         fields = '__all__'
 
+    def get_tags(self, obj):
+        return [tag.pk for tag in obj.get_template_source().tags.all()]
+
+    def get_subtasks(self, obj):
+        # Inherited subtasks carry the template's subtask IDs, toggle them
+        # through the instance (see InstanceSubtaskToggleView)
+        return [
+            {'id': subtask.id, 'title': subtask.title, 'is_completed': is_completed}
+            for subtask, is_completed in obj.get_subtask_states()
+        ]
+
     def get_subtasks_completion_percentage(self, obj):
         return obj.calculate_subtasks_completion_percentage()
 
@@ -170,4 +379,121 @@ class CategorySerializer(serializers.ModelSerializer):
         if not value or len(value) < 3:
             raise serializers.ValidationError('Category name must be atleast 3 characters long!')
         return value
-            
\ No newline at end of file
+            
+
+class BulkTaskFieldsSerializer(serializers.ModelSerializer):
+    """
+    Fields of one task in a bulk create or update. Category and tags are
+    plain IDs, their ownership is checked once for the whole batch.
+    """
+    category = serializers.IntegerField(required=False, allow_null=True)
+    tags = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    class Meta:
+        model = Task
+        fields = ('title', 'description', 'priority', 'due_date', 'category', 'tags', 'reminder')
+
+    def validate_due_date(self, value):
+        if value and value < timezone.now():
+            raise serializers.ValidationError('Due date cannot be in the past!')
+        return value
+
+    def validate_title(self, value):
+        if len(value) < 3:
+            raise serializers.ValidationError('Task name too short! Must be atleast 3 characters long')
+        return value
+
+    def validate(self, attrs):
+        reminder = attrs.get('reminder')
+        due_date = attrs.get('due_date')
+        if reminder and due_date and reminder > due_date:
+            raise serializers.ValidationError({'reminder': 'Reminder can not be after due date!'})
+        return attrs
+
+
+class BulkTaskOperationSerializer(serializers.Serializer):
+    """
+    One operation of a bulk request:
+    - create: `tasks` is a list of task payloads
+    - update: `tasks` is a list of partial payloads, each with the task `id`
+    - toggle, delete: `ids` is a list of task IDs
+    """
+    ACTION_CHOICES = ('create', 'update', 'toggle', 'delete')
+
+    action = serializers.ChoiceField(choices=ACTION_CHOICES)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    tasks = serializers.ListField(child=serializers.DictField(), required=False)
+
+    def validate(self, attrs):
+        action = attrs['action']
+        if action in ('toggle', 'delete'):
+            if not attrs.get('ids'):
+                raise serializers.ValidationError({'ids': f'Required for {action}'})
+            return attrs
+
+        if not attrs.get('tasks'):
+            raise serializers.ValidationError({'tasks': f'Required for {action}'})
+
+        tasks, errors = [], []
+        for item in attrs['tasks']:
+            serializer = BulkTaskFieldsSerializer(data=item, partial=action == 'update')
+            item_errors = {} if serializer.is_valid() else dict(serializer.errors)
+            data = dict(serializer.validated_data) if not item_errors else {}
+            if action == 'update':
+                try:
+                    data['id'] = int(item['id'])
+                except (KeyError, TypeError, ValueError):
+                    item_errors['id'] = ['A valid task ID is required']
+            errors.append(item_errors)
+            tasks.append(data)
+        if any(errors):
+            raise serializers.ValidationError({'tasks': errors})
+
+        attrs['tasks'] = tasks
+        return attrs
+
+
+class BulkTaskSerializer(serializers.Serializer):
+    """
+    A batch of task operations, run in order in one transaction.
+
+    Every task, category and tag referenced anywhere in the batch is checked
+    for ownership with one query per model.
+    """
+    MAX_ITEMS = 500
+
+    operations = BulkTaskOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, operations):
+        items = sum(len(operation.get('ids') or operation.get('tasks')) for operation in operations)
+        if items > self.MAX_ITEMS:
+            raise serializers.ValidationError(f'A bulk request can touch at most {self.MAX_ITEMS} tasks')
+        return operations
+
+    def validate(self, attrs):
+        user = self.context['request'].user
+        task_ids, category_ids, tag_ids = set(), set(), set()
+        for operation in attrs['operations']:
+            task_ids.update(operation.get('ids') or [])
+            for task in operation.get('tasks') or []:
+                if 'id' in task:
+                    task_ids.add(task['id'])
+                if task.get('category') is not None:
+                    category_ids.add(task['category'])
+                tag_ids.update(task.get('tags') or [])
+
+        errors = {}
+        for name, model, owner_field, ids in (
+            ('tasks', Task, 'user', task_ids),
+            ('categories', Category, 'owner', category_ids),
+            ('tags', Tag, 'owner', tag_ids),
+        ):
+            if not ids:
+                continue
+            owned = set(model.objects.filter(**{owner_field: user, 'id__in': ids}).values_list('id', flat=True))
+            missing = sorted(ids - owned)
+            if missing:
+                errors[name] = f'Do not exist or do not belong to you: {", ".join(map(str, missing))}'
+        if errors:
+            raise serializers.ValidationError(errors)
+        return attrs
@@ -0,0 +1,104 @@
+"""
+Sparse fieldsets: let clients pick the fields of list responses with
+`?fields=id,title` or drop some with `?omit=description,tags`.
+
+Narrowing the output also narrows the SQL: only the columns backing the
+chosen fields are loaded and relations that are not requested are not
+prefetched.
+"""
+from rest_framework.exceptions import ValidationError
+
+
+FIELDS_QUERY_PARAM = 'fields'
+OMIT_QUERY_PARAM = 'omit'
+
+
+def _split(value):
+    return [name.strip() for name in value.split(',') if name.strip()]
+
+
+def get_requested_fields(request, available_fields):
+    """
+    Return the tuple of fields selected by the request, in the order of
+    available_fields, or None if the request does not narrow the output.
+    Raises ValidationError for unknown field names.
+
+    Args:
+        request: The incoming request
+        available_fields: All fields the response can contain
+    """
+    fields = _split(request.query_params.get(FIELDS_QUERY_PARAM, ''))
+    omit = _split(request.query_params.get(OMIT_QUERY_PARAM, ''))
+    if not fields and not omit:
+        return None
+
+    errors = {}
+    for param, names in ((FIELDS_QUERY_PARAM, fields), (OMIT_QUERY_PARAM, omit)):
+        unknown = [name for name in names if name not in available_fields]
+        if unknown:
+            errors[param] = f'Unknown field(s): {", ".join(unknown)}'
+    if errors:
+        raise ValidationError(errors)
+
+    selected = set(fields or available_fields) - set(omit)
+    return tuple(name for name in available_fields if name in selected)
+
+
+def get_only_columns(field_names, field_columns):
+    """
+    Map response fields to the model columns they read, for QuerySet.only().
+    Fields without an entry in field_columns (e.g. many-to-many relations)
+    need no column. The primary key is always loaded.
+    """
+    columns = {'id'}
+    for name in field_names:
+        columns.update(field_columns.get(name, ()))
+    return sorted(columns)
+
+
+class SparseFieldsetMixin:
+    """
+    Serializer mixin dropping the fields not listed in the
+    `sparse_fields` serializer context entry.
+
+    `field_columns` maps each field to the model columns it reads.
+    """
+    field_columns = {}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        sparse_fields = self.context.get('sparse_fields')
+        if sparse_fields is not None:
+            for name in set(self.fields) - set(sparse_fields):
+                self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """
+    Generic view mixin resolving ?fields= / ?omit= against the view's
+    serializer and passing the result to it.
+    """
+
+    def get_sparse_fields(self):
+        if not hasattr(self, '_sparse_fields'):
+            serializer_class = self.get_serializer_class()
+            self._sparse_fields = get_requested_fields(self.request, serializer_class.Meta.fields)
+        return self._sparse_fields
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['sparse_fields'] = self.get_sparse_fields()
+        return context
+
+    def apply_sparse_fields(self, queryset, prefetches=()):
+        """
+        Load only the columns of the selected fields, and prefetch each
+        (field name, lookup) pair in prefetches only if that field is selected.
+        """
+        sparse_fields = self.get_sparse_fields()
+        if sparse_fields is None:
+            return queryset.prefetch_related(*(lookup for _, lookup in prefetches))
+
+        field_columns = self.get_serializer_class().field_columns
+        queryset = queryset.only(*get_only_columns(sparse_fields, field_columns))
+        return queryset.prefetch_related(*(lookup for name, lookup in prefetches if name in sparse_fields))
@@ -0,0 +1,167 @@
+"""
+Delta sync for task clients.
+
+Every write to a task, subtask, tag or category is recorded in the user's
+change log (SyncChange) under a new value of the user's change sequence.
+Clients keep the token returned by /api/tasks/changes/ and send it back to
+receive only what changed since, instead of re-downloading their lists.
+
+The sequence is incremented with an UPDATE of the user's SyncSequence row,
+which stays locked until the writing transaction commits. Writes of one
+user therefore commit in sequence order and a client can never skip a
+change that becomes visible after it synced.
+
+Deleted objects are kept as tombstones for TOMBSTONE_RETENTION. Tokens older
+than that are rejected, since the deletes they would need may be gone.
+"""
+import base64
+import json
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .models import SubTask, SyncChange, SyncSequence, Task
+
+
+TASK = 'task'
+SUBTASK = 'subtask'
+TAG = 'tag'
+CATEGORY = 'category'
+
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+# Maximum number of changes returned per sync response
+SYNC_PAGE_SIZE = 500
+
+
+def next_change_seq(user_id):
+    """
+    Increment the user's change sequence and return the new value.
+    Must run inside the transaction of the write it numbers.
+    """
+    updated = SyncSequence.objects.filter(user_id=user_id).update(value=F('value') + 1)
+    if not updated:
+        try:
+            with transaction.atomic():
+                SyncSequence.objects.create(user_id=user_id, value=1)
+            return 1
+        except IntegrityError:
+            # Created concurrently, increment the existing row
+            SyncSequence.objects.filter(user_id=user_id).update(value=F('value') + 1)
+    return SyncSequence.objects.filter(user_id=user_id).values_list('value', flat=True).get()
+
+
+def get_current_seq(user_id):
+    return SyncSequence.objects.filter(user_id=user_id).values_list('value', flat=True).first() or 0
+
+
+def record_changes(user_id, kind, object_ids, deleted=False):
+    """
+    Record that objects of one kind were created/updated (or deleted)
+    for a user. All of them share a single new sequence value.
+
+    Args:
+        user_id: The ID of the user owning the objects
+        kind: TASK, SUBTASK, TAG or CATEGORY
+        object_ids: IDs of the changed objects
+        deleted: Whether the objects were deleted (writes tombstones)
+    """
+    object_ids = set(object_ids)
+    if not object_ids:
+        return
+
+    with transaction.atomic(savepoint=False):
+        seq = next_change_seq(user_id)
+        SyncChange.objects.bulk_create(
+            [
+                SyncChange(user_id=user_id, kind=kind, object_id=object_id, seq=seq, deleted=deleted)
+                for object_id in object_ids
+            ],
+            update_conflicts=True,
+            unique_fields=['user', 'kind', 'object_id'],
+            update_fields=['seq', 'deleted', 'changed_at'],
+        )
+
+
+def record_task_deletions(tasks):
+    """
+    Write tombstones for a queryset of tasks that is about to be deleted,
+    including the recurring instances and subtasks removed with them by
+    CASCADE. Call it before deleting, in the same transaction.
+    """
+    task_ids = set(tasks.values_list('id', flat=True))
+    task_ids.update(Task.objects.filter(parent_recurring_task__in=task_ids).values_list('id', flat=True))
+
+    deleted = defaultdict(lambda: defaultdict(set))
+    for task_id, user_id in Task.objects.filter(id__in=task_ids).values_list('id', 'user_id'):
+        deleted[user_id][TASK].add(task_id)
+    subtasks = SubTask.objects.filter(parent_task__in=task_ids).values_list('id', 'parent_task__user_id')
+    for subtask_id, user_id in subtasks:
+        deleted[user_id][SUBTASK].add(subtask_id)
+
+    for user_id, kinds in deleted.items():
+        for kind, object_ids in kinds.items():
+            record_changes(user_id, kind, object_ids, deleted=True)
+
+
+def encode_sync_token(seq, issued_at=None):
+    """
+    Build a sync token for sequence value `seq`. Tokens continuing a
+    partial response keep the issue time of the token they continue.
+    """
+    if issued_at is None:
+        issued_at = int(time.time())
+    payload = json.dumps({'s': seq, 't': issued_at}, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip('=')
+
+
+def decode_sync_token(token):
+    """
+    Return (seq, issued_at) from a sync token.
+    Raises ValidationError for malformed tokens.
+    """
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        payload = json.loads(data)
+        return int(payload['s']), int(payload['t'])
+    except Exception:
+        raise ValidationError({'since': 'Invalid sync token'})
+
+
+def is_token_expired(issued_at):
+    return issued_at < time.time() - TOMBSTONE_RETENTION.total_seconds()
+
+
+def get_changes(user_id, since, limit=SYNC_PAGE_SIZE):
+    """
+    Return (changes, has_more): the user's changes after sequence value
+    `since`, ordered by sequence. Changes sharing a sequence value are
+    never split between responses, so slightly more than `limit` changes
+    may be returned.
+    """
+    changes = SyncChange.objects.filter(user_id=user_id, seq__gt=since).order_by('seq')
+    boundary = list(changes.values_list('seq', flat=True)[limit - 1:limit])
+    if not boundary:
+        return list(changes), False
+    boundary = boundary[0]
+    return list(changes.filter(seq__lte=boundary)), changes.filter(seq__gt=boundary).exists()
+
+
+def compact_tombstones(batch_size=5000):
+    """Delete tombstones older than TOMBSTONE_RETENTION, in batches."""
+    # The margin covers tombstones written before a token was issued but
+    # committed after it
+    threshold = timezone.now() - TOMBSTONE_RETENTION - timedelta(hours=1)
+    expired = SyncChange.objects.filter(deleted=True, changed_at__lt=threshold)
+
+    total = 0
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return total
+        total += SyncChange.objects.filter(id__in=ids).delete()[0]
@@ -1,74 +1,128 @@
-from celery import shared_task
-from datetime import timedelta
+import time
+from celery import chord, shared_task
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 
 from django.conf import settings
+from django.core.cache import cache
 from django.utils import timezone
 from django.db import transaction
-from django.core.mail import send_mail
+from django.db.models import Case, Count, Exists, F, Max, Min, OuterRef, Q, When
+from django.db.models.functions import Greatest, Mod
+from django.db.models.lookups import Exact
+from django.core.mail import send_mail, send_mass_mail
 from django.contrib.auth import get_user_model
 
-from .models import Task, SubTask
-from user.models import MyUser
-from user.services import award_karma_to_user
+from .models import Task
+from .cache_utils import (
+    invalidate_calendar_density,
+    invalidate_task_cache_for_users,
+)
+from .claims import claim_rows
+from .recurrence import get_template_shards, materialize_recurring_tasks
+from .reminders import (
+    REMINDER_RETRY_DELAY, acknowledge_reminders, ensure_reminder_schedule, get_pending_reminders,
+    pop_due_reminders, requeue_stalled_reminders, restore_reminders, schedule_reminders,
+)
+from .sync import compact_tombstones, record_task_deletions
+from user.models import KarmaTransaction, MyUser
+from user.badges import award_badges_in_bulk, get_earned_badge_ids
+from user.leaderboard import update_leaderboard
+from user.rollup import record_karma_rollup
 
 user = get_user_model()
 
+MORNING_DIGEST = 'morning'
+EVENING_DIGEST = 'evening'
+
+# User column stamped with the day each digest was sent
+DIGEST_SENT_FIELDS = {
+    MORNING_DIGEST: 'morning_digest_sent_on',
+    EVENING_DIGEST: 'evening_digest_sent_on',
+}
+
+# Users per send_daily_digests job
+DIGEST_CHUNK_SIZE = 200
+
+# Retries of a digest chunk whose emails failed, and the seconds between them
+DIGEST_MAX_RETRIES = 3
+DIGEST_RETRY_DELAY = 300
+
+# Users per send_weekly_report_chunk job
+WEEKLY_REPORT_CHUNK_SIZE = 200
+
+# Width of the user id range handled by one streak worker task
+STREAK_SHARD_SIZE = 10000
+
+# Summary of the last weekly report run
+WEEKLY_REPORT_SUMMARY_KEY = 'tasks:weekly_report_summary'
+
+
 @shared_task
 def create_task_with_recurrence_rule():
-    now=timezone.now()
-    tasks = Task.objects.filter(
-                                recurrence_rule__next_occurance__lte=now,
-                                is_recurring=True,
-                                parent_recurring_task=None,
-                                )
-    with transaction.atomic():
-        for template in tasks:
-            today = timezone.now()
-            task_copy_due_date = today.replace(
-                hour=template.due_date.hour,
-                minute=template.due_date.minute,
-                second=0,
-                microsecond=0
-            )
-            task_copy = Task.objects.create(
-                user=template.user,
-                title=template.title,
-                description=template.description,
-                is_completed=False,
-                priority=template.priority,
-                due_date = task_copy_due_date,
-                is_recurring=False,
-                category=template.category,
-                parent_recurring_task=template
-            )
-            task_copy.tags.set(template.tags.all())
-            for subtask in template.subtasks.all():
-                SubTask.objects.create(
-                    title=subtask.title,
-                    parent_task=task_copy,
-                    is_completed=False
-                )
-            template.recurrence_rule.calculate_next_occurrence()
-            template.recurrence_rule.save()
+    """
+    Materialize due recurring templates, one worker task per template id
+    range. Returns the number of shards queued.
+    """
+    shards = get_template_shards()
+    for min_template_id, max_template_id in shards:
+        materialize_recurring_shard.delay(min_template_id, max_template_id)
+    return len(shards)
+
+
+@shared_task
+def materialize_recurring_shard(min_template_id, max_template_id):
+    return materialize_recurring_tasks(
+        min_template_id=min_template_id,
+        max_template_id=max_template_id,
+    )
+
+
+@shared_task
+def dispatch_due_reminders():
+    """
+    Pop the due reminders from the reminder schedule and queue their
+    emails in batches. Runs every few seconds, see task.reminders.
+    """
+    ensure_reminder_schedule()
+    requeue_stalled_reminders(timezone.now())
+    dispatched = 0
+    while True:
+        task_ids = pop_due_reminders(timezone.now())
+        if not task_ids:
+            return dispatched
+        send_reminder_emails.delay(task_ids)
+        dispatched += len(task_ids)
 
 
 @shared_task
-def send_reminder_email():
-    tasks = Task.objects.filter(reminder__isnull = False,
-                                reminder__lte=timezone.now(),
-                                is_completed=False,
-                                expired=False,)
+def send_reminder_emails(task_ids):
+    now = timezone.now()
+    pending = get_pending_reminders().filter(id__in=task_ids)
+
+    # Claiming clears the reminders with one UPDATE, so a task queued twice
+    # (or held by another worker) is sent once
+    tasks = claim_rows(pending.filter(reminder__lte=now).select_related('user').order_by('id'), reminder=None)
+    failed = []
     for task in tasks:
-        time_left = task.due_date - timezone.now() if task.due_date else None
-        send_mail(
-            subject='Reminder',
-            message=f'Do not forget to complete "{task}" task. Time left: {time_left}',
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[task.user.email],
-            fail_silently=False,
-        )
-        task.reminder = None
-        task.save()
+        time_left = task.due_date - now if task.due_date else None
+        try:
+            send_mail(
+                subject='Reminder',
+                message=f'Do not forget to complete "{task}" task. Time left: {time_left}',
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                recipient_list=[task.user.email],
+                fail_silently=False,
+            )
+        except Exception:
+            # Not sent, the claim must not swallow the reminder
+            failed.append(task)
+    if failed:
+        restore_reminders(failed, now + timedelta(seconds=REMINDER_RETRY_DELAY))
+
+    # Moved later after they were popped, put them back on the schedule
+    schedule_reminders(pending.filter(reminder__gt=now))
+    acknowledge_reminders(task_ids)
 
 
 @shared_task
@@ -86,128 +140,337 @@ def check_tasks_expiration():
 def delete_old_expired_tasks():
     threshold_date = timezone.now() - timedelta(days=30)
 
-    Task.objects.filter(
+    old_expired_tasks = Task.objects.filter(
         expired=True,
         is_completed=False,
         due_date__lt=threshold_date
-    ).delete()
+    )
+    due_dates = defaultdict(list)
+    for user_id, due_date in old_expired_tasks.values_list('user_id', 'due_date'):
+        due_dates[user_id].append(due_date)
+    with transaction.atomic():
+        record_task_deletions(old_expired_tasks)
+        old_expired_tasks.delete()
+    invalidate_task_cache_for_users(due_dates)
+    for user_id, user_due_dates in due_dates.items():
+        invalidate_calendar_density(user_id, user_due_dates)
 
 
 @shared_task
-def send_amount_of_tasks_for_today():
-    today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = today_start + timedelta(days=1)
+def compact_sync_tombstones():
+    """Expire delta sync tombstones older than the sync token lifetime."""
+    return compact_tombstones()
 
-    for user in MyUser.objects.filter(is_active=True):
-        tasks_for_today = Task.objects.filter(
-            user=user,
-            is_completed=False,
-            due_date__gte=today_start,
-            due_date__lt=today_end,
-        ).order_by('due_date', 'priority')
 
-        if tasks_for_today.exists():
-            send_mail(
-                subject='TaskSphere',
-                message=f'Hello {user.username}! You have {tasks_for_today.count()} tasks for today\n\n'
-                        f'Have a productive day!',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
-        else:
-            send_mail(
-                subject='TaskSphere',
-                message=f'Hello {user.username}! You have no task for today.\n\n'
-                        f'Have a nice day! ',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+@shared_task
+def send_amount_of_tasks_for_today():
+    """Queue the morning digest of every active user, in chunks."""
+    return queue_daily_digests(MORNING_DIGEST)
 
 
 @shared_task
 def send_amount_of_tasks_left_for_today():
+    """Queue the evening digest of every user with tasks left for today, in chunks."""
+    return queue_daily_digests(EVENING_DIGEST)
+
+
+def get_today_bounds():
     today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
-    today_end = today_start + timedelta(days=1)
+    return today_start, today_start + timedelta(days=1)
 
-    for user in MyUser.objects.filter(is_active=True):
-        tasks_for_today = Task.objects.filter(
-            user=user,
-            due_date__gte=today_start,
-            due_date__lt=today_end,
-            is_completed=False
-        ).order_by('due_date', 'priority')
 
-        if tasks_for_today.exists():
-            send_mail(
-                subject='TaskSphere',
-                message=f'{user.username}, the day is nearing its end! .You have {tasks_for_today.count()} incompleted tasks left for today\n\n'
-                        f'',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+def get_digest_tasks(today_start, today_end):
+    """Incomplete tasks due today, the ones the daily digests count."""
+    return Task.objects.filter(
+        is_completed=False,
+        due_date__gte=today_start,
+        due_date__lt=today_end,
+    )
+
+
+def get_digest_recipients(kind, today):
+    """Active users who did not get today's digest of this kind yet."""
+    sent_on = DIGEST_SENT_FIELDS[kind]
+    return MyUser.objects.filter(
+        Q(**{f'{sent_on}__isnull': True}) | Q(**{f'{sent_on}__lt': today}),
+        is_active=True,
+    )
+
+
+def queue_daily_digests(kind):
+    """
+    Stream the IDs of the digest's recipients and queue one
+    send_daily_digests job per DIGEST_CHUNK_SIZE of them.
+    Returns the number of jobs queued.
+    """
+    today_start, today_end = get_today_bounds()
+    recipients = get_digest_recipients(kind, today_start.date())
+    if kind == EVENING_DIGEST:
+        # The evening digest only goes to users with tasks left
+        recipients = recipients.filter(
+            id__in=get_digest_tasks(today_start, today_end).values('user_id')
+        )
+
+    queued = 0
+    chunk = []
+    for user_id in recipients.order_by('id').values_list('id', flat=True).iterator(chunk_size=DIGEST_CHUNK_SIZE):
+        chunk.append(user_id)
+        if len(chunk) == DIGEST_CHUNK_SIZE:
+            send_daily_digests.delay(kind, chunk)
+            queued += 1
+            chunk = []
+    if chunk:
+        send_daily_digests.delay(kind, chunk)
+        queued += 1
+    return queued
+
+
+def release_digest_claims(users, kind, today):
+    """
+    Give the claimed users their previous sent-on date back, so the digest
+    can be sent again. Users claimed again meanwhile are left alone.
+    """
+    sent_on = DIGEST_SENT_FIELDS[kind]
+    previous = defaultdict(list)
+    for user in users:
+        previous[getattr(user, sent_on)].append(user.id)
+    for sent_on_value, ids in previous.items():
+        MyUser.objects.filter(id__in=ids, **{sent_on: today}).update(**{sent_on: sent_on_value})
+
+
+@shared_task(bind=True, max_retries=DIGEST_MAX_RETRIES, default_retry_delay=DIGEST_RETRY_DELAY)
+def send_daily_digests(self, kind, user_ids):
+    """
+    Send the digest to a chunk of users. The users are claimed by stamping
+    today's date first, so a chunk queued twice (or by overlapping runs)
+    is sent once. If the emails fail, the claim is released and the chunk
+    retried. Returns the number of emails sent.
+    """
+    today_start, today_end = get_today_bounds()
+    sent_on = DIGEST_SENT_FIELDS[kind]
+    users = claim_rows(
+        get_digest_recipients(kind, today_start.date()).filter(id__in=user_ids).only('id', 'username', 'email', sent_on).order_by('id'),
+        **{sent_on: today_start.date()}
+    )
+    if not users:
+        return 0
+
+    # Today's task count of every user of the chunk in one grouped query
+    counts = dict(
+        get_digest_tasks(today_start, today_end)
+        .filter(user_id__in=[user.id for user in users])
+        .values_list('user_id')
+        .annotate(count=Count('id'))
+        .order_by()
+    )
+
+    messages = []
+    for user in users:
+        count = counts.get(user.id, 0)
+        if kind == MORNING_DIGEST:
+            if count:
+                message = (f'Hello {user.username}! You have {count} tasks for today\n\n'
+                           f'Have a productive day!')
+            else:
+                message = (f'Hello {user.username}! You have no task for today.\n\n'
+                           f'Have a nice day! ')
+        elif count:
+            message = (f'{user.username}, the day is nearing its end! .You have {count} incompleted tasks left for today\n\n'
+                       f'')
+        else:
+            continue
+        messages.append(('TaskSphere', message, settings.DEFAULT_FROM_EMAIL, [user.email]))
+
+    # One mail connection for the whole chunk. If it fails, the whole chunk
+    # is sent again: a few users may get the digest twice, none lose it.
+    try:
+        return send_mass_mail(messages, fail_silently=False)
+    except Exception as exc:
+        release_digest_claims(users, kind, today_start.date())
+        raise self.retry(exc=exc)
 
 
 @shared_task
 def send_weekly_reports():
+    """
+    Compute the weekly numbers of every active user in one grouped query
+    and send the reports as a group of chunk jobs. A final job stores the
+    run's summary under WEEKLY_REPORT_SUMMARY_KEY.
+    Returns the number of users with a report.
+    """
+    started_at = time.time()
     week_ago = timezone.now() - timedelta(days=7)
 
-    for user in MyUser.objects.filter(is_active=True):
-        completed_tasks = Task.objects.filter(
-            user=user,
-            is_completed=True,
-            updated_at__gte=week_ago,
-        ).count()
+    # Completed and created this week, per user, in one pass over the
+    # week's tasks
+    stats = (
+        Task.objects.filter(
+            Q(created_at__gte=week_ago) | Q(is_completed=True, updated_at__gte=week_ago),
+            user__is_active=True,
+        )
+        .values_list('user_id')
+        .annotate(
+            completed=Count('id', filter=Q(is_completed=True, updated_at__gte=week_ago)),
+            total=Count('id', filter=Q(created_at__gte=week_ago)),
+        )
+        .filter(total__gt=0)
+        .order_by('user_id')
+    )
+
+    chunks = []
+    chunk = []
+    for row in stats.iterator(chunk_size=WEEKLY_REPORT_CHUNK_SIZE):
+        chunk.append(list(row))
+        if len(chunk) == WEEKLY_REPORT_CHUNK_SIZE:
+            chunks.append(chunk)
+            chunk = []
+    if chunk:
+        chunks.append(chunk)
+
+    users = sum(len(chunk) for chunk in chunks)
+    summary = summarize_weekly_reports.s(users=users, started_at=started_at)
+    if chunks:
+        chord(send_weekly_report_chunk.s(chunk, week_ago.isoformat()) for chunk in chunks)(summary)
+    else:
+        summary.delay([])
+    return users
 
-        total_tasks = Task.objects.filter(
-            user=user,
-            created_at__gte=week_ago
-        ).count()
 
-        if total_tasks > 0:
-            completion_rate = (completed_tasks/total_tasks) * 100
+@shared_task
+def send_weekly_report_chunk(stats, week_ago):
+    """
+    Render and send the weekly reports of a chunk of users, given as
+    [user_id, completed, total] rows. Returns the number of emails sent.
+    """
+    week_ago = datetime.fromisoformat(week_ago)
+    stats = {user_id: (completed, total) for user_id, completed, total in stats}
+    users = MyUser.objects.filter(id__in=stats).only('id', 'username', 'email', 'current_streak', 'highest_streak').order_by('id')
+
+    # Tasks completed this week per category, for the whole chunk
+    categories = defaultdict(list)
+    for user_id, category, count in (
+        Task.objects.filter(user_id__in=stats, is_completed=True, updated_at__gte=week_ago)
+        .values_list('user_id', 'category__name')
+        .annotate(count=Count('id'))
+        .order_by('user_id', '-count', 'category__name')
+    ):
+        categories[user_id].append((category or 'Uncategorized', count))
+
+    messages = []
+    for user in users:
+        completed_tasks, total_tasks = stats[user.id]
+        completion_rate = round((completed_tasks/total_tasks) * 100)
+        breakdown = ''.join(f'  {category}: {count}\n' for category, count in categories[user.id])
+        messages.append((
+            'Your weekly progress report',
+            f'Hello {user.username}! \n\n'
+            f'Tasks completed in this week: {completed_tasks}/{total_tasks}({completion_rate}%)\n'
+            + (f'\nCompleted by category:\n{breakdown}' if breakdown else '')
+            + f'\nCurrent streak: {user.current_streak} days (best: {user.highest_streak})\n\n'
+            f'Keep up the good work!',
+            settings.DEFAULT_FROM_EMAIL,
+            [user.email],
+        ))
+
+    # One mail connection for the whole chunk. If it fails, the whole chunk
+    # is sent again: a few users may get the digest twice, none lose it.
+    try:
+        return send_mass_mail(messages, fail_silently=False)
+    except Exception as exc:
+        release_digest_claims(users, kind, today_start.date())
+        raise self.retry(exc=exc)
 
-            send_mail(
-                subject='Your weekly progress report',
-                message=f'Hello {user.username}! \n\n'
-                        f'Tasks completed in this week: {completed_tasks}/{total_tasks}({completion_rate})\n'
-                        f'Keep up the good work!',
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+
+@shared_task
+def summarize_weekly_reports(sent, users, started_at):
+    """Store the summary of a weekly report run, given the chunks' sent counts."""
+    summary = {
+        'finished_at': timezone.now().isoformat(),
+        'users': users,
+        'emails_sent': sum(sent),
+        'seconds': round(time.time() - started_at, 2),
+    }
+    cache.set(WEEKLY_REPORT_SUMMARY_KEY, summary, timeout=None)
+    return summary
 
 
 @shared_task
 def calculate_user_streak():
-    for user in MyUser.objects.filter(is_active=True):
-        yesterday = timezone.now().date() - timedelta(days=1)
-        completed_yesterday = Task.objects.filter(
-            user=user,
-            is_completed=True,
-            updated_at__date = yesterday,
-        ).exists()
+    """
+    Update the streaks for yesterday, one worker task per user id range.
+    Returns the number of shards queued.
+    """
+    yesterday = timezone.now().date() - timedelta(days=1)
+    bounds = MyUser.objects.filter(is_active=True).aggregate(low=Min('id'), high=Max('id'))
+    if bounds['low'] is None:
+        return 0
 
-        if completed_yesterday:
-            user.current_streak += 1
-            user.save()
+    shards = range(bounds['low'], bounds['high'] + 1, STREAK_SHARD_SIZE)
+    for low in shards:
+        calculate_user_streak_shard.delay(yesterday.isoformat(), low, low + STREAK_SHARD_SIZE - 1)
+    return len(shards)
 
-            award_karma_to_user(user=user, amount=20, reason='Daily streak maintained')
 
-            if user.current_streak % 7 == 0:
-                award_karma_to_user(user=user, amount=350, reason='7 days streak bonus')
-
-            if user.current_streak % 30 == 0:
-                award_karma_to_user(user=user, amount=1000, reason='30 days streak bonus')
+@shared_task
+def calculate_user_streak_shard(day, min_user_id, max_user_id):
+    """
+    Update the streaks of the active users with ids between min_user_id and
+    max_user_id for `day`: users who completed a task that (local) day keep
+    their streak and get the streak karma, everyone else loses it.
+    Returns the number of streaks kept.
+    """
+    day = date.fromisoformat(day)
+    day_start = timezone.make_aware(datetime.combine(day, datetime.min.time()))
+    day_end = timezone.make_aware(datetime.combine(day + timedelta(days=1), datetime.min.time()))
+    completed_that_day = Exists(Task.objects.filter(
+        user=OuterRef('pk'),
+        is_completed=True,
+        updated_at__gte=day_start,
+        updated_at__lt=day_end,
+    ))
+    users = MyUser.objects.filter(is_active=True, id__gte=min_user_id, id__lte=max_user_id)
 
-        else:
-            # User missed a day - update highest streak if needed, then reset
-            if user.current_streak > user.highest_streak:
-                user.highest_streak = user.current_streak
-            user.current_streak = 0
-            user.save()
+    with transaction.atomic():
+        kept_ids = list(users.filter(completed_that_day).values_list('id', flat=True))
+
+        # Streak karma, by the streak reached today
+        new_streak = F('current_streak') + 1
+        users.filter(id__in=kept_ids).update(
+            current_streak=new_streak,
+            karma=F('karma') + 20
+                  + Case(When(Exact(Mod(new_streak, 7), 0), then=350), default=0)
+                  + Case(When(Exact(Mod(new_streak, 30), 0), then=1000), default=0),
+        )
 
+        # User missed a day - update highest streak if needed, then reset
+        users.filter(~completed_that_day, current_streak__gt=0).update(
+            highest_streak=Greatest('highest_streak', 'current_streak'),
+            current_streak=0,
+        )
 
-    
\ No newline at end of file
+        # Read back what the UPDATE wrote: its row locks are held until
+        # commit, so karma awarded concurrently elsewhere is included
+        kept = users.filter(id__in=kept_ids).values_list('id', 'current_streak', 'karma')
+
+        transactions = []
+        promoted = []
+        scores = {}
+        for user_id, streak, karma in kept:
+            awarded = [(20, 'Daily streak maintained')]
+            if streak % 7 == 0:
+                awarded.append((350, '7 days streak bonus'))
+            if streak % 30 == 0:
+                awarded.append((1000, '30 days streak bonus'))
+            transactions += [KarmaTransaction(user_id=user_id, amount=amount, reason=reason) for amount, reason in awarded]
+
+            old_karma = karma - sum(amount for amount, _ in awarded)
+            scores[user_id] = karma
+            if set(get_earned_badge_ids(karma)) - set(get_earned_badge_ids(old_karma)):
+                promoted.append((user_id, karma))
+        KarmaTransaction.objects.bulk_create(transactions, batch_size=1000)
+        record_karma_rollup(transactions)
+
+        # Badges only for the users who reached a new tier
+        award_badges_in_bulk(promoted)
+        update_leaderboard(scores)
+    return len(scores)
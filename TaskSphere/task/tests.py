@@ -0,0 +1,183 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from user.models import MyUser
+from .models import Category, RecurrenceRule, SubTask, Tag, Task
+from .serializers import TasksListFastSerializer, TasksListSerializer
+from .views import tag_ids_prefetch
+
+
+class TasksListFastSerializerParityTests(TestCase):
+    """TasksListFastSerializer must render exactly what TasksListSerializer does."""
+
+    sparse_fieldsets = [
+        None,
+        ('id', 'tags'),
+        ('id', 'is_overdue', 'due_date'),
+        ('title', 'subtasks_completion_percentage', 'category'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = MyUser.objects.create(username='parity', email='parity@example.com')
+        category = Category.objects.create(name='parity category', owner=cls.user)
+        tags = [Tag.objects.create(name=f'parity tag {i}', owner=cls.user) for i in range(4)]
+        now = timezone.now()
+
+        tasks = []
+        for i in range(60):
+            task = Task.objects.create(
+                user=cls.user,
+                title=f'task {i} "ü" <b>',
+                description=[None, '', 'line\nbreak'][i % 3],
+                priority=[choice for choice, _ in Task.PRIORITY_CHOICES][i % 5],
+                due_date=[None, now - timedelta(days=i, microseconds=i * 7919), now + timedelta(days=i % 9)][i % 3],
+                is_completed=i % 4 == 0,
+                category=category if i % 2 else None,
+            )
+            task.tags.set(tags[:i % 5])
+            for j in range(i % 4):
+                SubTask.objects.create(parent_task=task, title=f'sub {j}', is_completed=j % 2 == 0)
+            tasks.append(task)
+
+        # A recurring template with an instance that inherits its tags, and
+        # one that has its own (see Task.inherits_template)
+        template = Task.objects.create(
+            user=cls.user,
+            title='template',
+            priority='low',
+            due_date=now + timedelta(days=1),
+            is_recurring=True,
+            recurrence_rule=RecurrenceRule.objects.create(frequency='daily', next_occurance=now + timedelta(days=2)),
+        )
+        template.tags.set(tags[1:3])
+        Task.objects.create(
+            user=cls.user, title='template', priority='low', due_date=now - timedelta(days=1),
+            parent_recurring_task=template, inherits_template=True,
+        )
+        detached = Task.objects.create(
+            user=cls.user, title='template', priority='low', due_date=now,
+            parent_recurring_task=template,
+        )
+        detached.tags.set(tags[:1])
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def render(self, serializer_class, queryset, fields):
+        serializer = serializer_class(queryset, many=True, context={'sparse_fields': fields})
+        return JSONRenderer().render(serializer.data)
+
+    def test_serializers_render_identical_output(self):
+        tasks = Task.objects.filter(user=self.user).order_by('-created_at', '-id')
+        for fields in self.sparse_fieldsets:
+            with self.subTest(fields=fields):
+                expected = self.render(TasksListSerializer, tasks.prefetch_related(tag_ids_prefetch()), fields)
+                actual = self.render(
+                    TasksListFastSerializer,
+                    tasks.values(*TasksListFastSerializer.get_columns(fields)),
+                    fields,
+                )
+                self.assertEqual(actual, expected)
+
+    def get_pages(self, url):
+        pages = []
+        while url:
+            cache.clear()
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(response.json()['results'])
+            url = response.json()['next']
+        return pages
+
+    def assert_views_match(self, url):
+        with override_settings(TASK_LIST_FAST_SERIALIZER=False):
+            expected = self.get_pages(url)
+        with override_settings(TASK_LIST_FAST_SERIALIZER=True):
+            actual = self.get_pages(url)
+        self.assertEqual(actual, expected)
+        self.assertTrue(expected)
+
+    def test_list_view_parity(self):
+        for url in [
+            '/api/tasks/list/?page_size=17',
+            '/api/tasks/list/?page_size=25&ordering=due_date',
+            '/api/tasks/list/?fields=id,tags&page_size=40',
+            '/api/tasks/list/?omit=description,tags&page_size=30',
+        ]:
+            with self.subTest(url=url):
+                self.assert_views_match(url)
+
+    def test_calendar_view_parity(self):
+        # Real rows come from the fast path, the template's virtual
+        # occurrences from TasksListSerializer
+        self.assert_views_match('/api/tasks/calendar/?start_date=2000-01-01&end_date=2100-01-01&page_size=16')
+        self.assert_views_match('/api/tasks/calendar/?start_date=2000-01-01&end_date=2100-01-01&fields=id,tags,due_date')
+
+
+class QueryPlanTests(TestCase):
+    """
+    The hot Task queries must use an index once the table holds a realistic
+    amount and mix of rows (check_query_plans analyzes it first).
+    """
+
+    users = 40
+    tasks_per_user = 250
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        users = MyUser.objects.bulk_create([
+            MyUser(username=f'plans{i}', email=f'plans{i}@example.com') for i in range(cls.users)
+        ])
+        cls.user = users[0]
+
+        # Two years of history: most tasks done, a few expired, pending
+        # reminders only on recent unfinished ones, a handful of templates
+        tasks = []
+        for user in users:
+            for i in range(cls.tasks_per_user):
+                is_completed = i % 10 < 7
+                expired = not is_completed and i % 20 == 7
+                due_date = None if i % 5 == 0 else now + timedelta(days=i * 3 - 600, hours=i % 24)
+                tasks.append(Task(
+                    user=user,
+                    title=f'task {i}',
+                    priority='low',
+                    is_completed=is_completed,
+                    expired=expired,
+                    due_date=due_date,
+                    reminder=due_date if due_date and due_date > now and not is_completed and i % 4 == 0 else None,
+                ))
+        Task.objects.bulk_create(tasks, batch_size=2000)
+
+        ids = list(Task.objects.order_by('id').values_list('id', flat=True))
+        for day in range(0, 730, 5):
+            chunk = ids[day * len(ids) // 730:(day + 5) * len(ids) // 730]
+            Task.objects.filter(id__in=chunk).update(
+                created_at=now - timedelta(days=730 - day),
+                updated_at=now - timedelta(days=725 - day),
+            )
+
+        for user in users[:5]:
+            Task.objects.create(
+                user=user,
+                title='template',
+                priority='low',
+                is_recurring=True,
+                recurrence_rule=RecurrenceRule.objects.create(frequency='weekly', next_occurance=now),
+            )
+
+    def test_hot_queries_use_indexes(self):
+        stdout = StringIO()
+        call_command('check_query_plans', user_id=self.user.id, stdout=stdout)
+        self.assertNotIn('sequential scan', stdout.getvalue())
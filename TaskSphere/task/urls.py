@@ -7,7 +7,11 @@ from .views import (
     DeleteTaskView,
     ToggleTaskCompletion,
     SubtaskToggleView,
+    InstanceSubtaskToggleView,
     CalendarTasksView,
+    CalendarDensityView,
+    TaskChangesView,
+    BulkTaskView,
     CategoryListView,
     CategoryCreateView,
     CategoryDetailView,
@@ -29,9 +33,13 @@ urlpatterns = [
     path('<int:pk>/delete/', DeleteTaskView.as_view(), name='delete-task'),
     path('<int:pk>/toggle/', ToggleTaskCompletion.as_view(), name='toggle-task-completion'),
     path('calendar/', CalendarTasksView.as_view(), name='calendar-tasks'),
+    path('calendar/density/', CalendarDensityView.as_view(), name='calendar-density'),
+    path('changes/', TaskChangesView.as_view(), name='task-changes'),
+    path('bulk/', BulkTaskView.as_view(), name='bulk-tasks'),
     
     # Subtasks
     path('subtask/<int:pk>/toggle/', SubtaskToggleView.as_view(), name='toggle-subtask'),
+    path('<int:task_pk>/subtask/<int:pk>/toggle/', InstanceSubtaskToggleView.as_view(), name='toggle-task-subtask'),
     
     # Categories
     path('categories/', CategoryListView.as_view(), name='category-list'),
@@ -1,25 +1,118 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import generics
 from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.fields import DateTimeField
 from rest_framework.permissions import IsAuthenticated
 
 from django_filters.rest_framework import DjangoFilterBackend
+from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 
 from .serializers import (
     CreateTaskSerializer,
     TasksListSerializer,
+    TasksListFastSerializer,
     TaskDetailSerializer,
+    BulkTaskSerializer,
+    SubtaskSerializer,
     CategorySerializer,
     TagSerializer
     )
 from .models import Category, Tag, Task, SubTask
 from .filters import TaskFilter
+from .reminders import schedule_reminders
+from .recurrence import (
+    RECURRENCE_CATCH_UP,
+    detach_instances,
+    get_inheriting_instance_ids,
+    get_occurrence_due_date,
+    )
+from .pagination import TaskKeysetPagination, CalendarKeysetPagination
+from .sparse_fields import SparseFieldsetViewMixin
+from .cache_utils import (
+    CALENDAR_DENSITY_CACHE_TIMEOUT,
+    TASK_LIST_CACHE_TIMEOUT,
+    build_cached_response,
+    get_calendar_density_versions,
+    get_not_modified_response,
+    get_task_cache_state,
+    get_task_list_window,
+    invalidate_calendar_density,
+    invalidate_user_task_cache,
+    make_cached_response,
+    make_calendar_density_cache_key,
+    make_etag,
+    make_task_list_cache_key,
+    normalize_filter_params,
+    patch_conditional_headers,
+    )
+from .sync import (
+    CATEGORY,
+    SUBTASK,
+    TAG,
+    TASK,
+    decode_sync_token,
+    encode_sync_token,
+    get_changes,
+    get_current_seq,
+    is_token_expired,
+    record_changes,
+    record_task_deletions,
+    )
 
 from user.services import award_karma_to_user
 
 
+# Karma awarded for completing (or deducted for reopening) a task
+TASK_KARMA = {
+    'low': 5,
+    'medium': 10,
+    'important': 15,
+    'very_important': 20,
+    'extremely_important': 25
+}
+
+
+def tag_ids_prefetch():
+    """Task lists only render tag IDs, in ascending order."""
+    return Prefetch('tags', queryset=Tag.objects.only('id').order_by('id'))
+
+
+def inherited_tag_ids_prefetch():
+    """Tag IDs of the templates recurring instances inherit their tags from."""
+    return Prefetch(
+        'parent_recurring_task',
+        queryset=Task.objects.only('id').prefetch_related(tag_ids_prefetch()),
+    )
+
+
+class TaskListSerializerMixin(SparseFieldsetViewMixin):
+    """
+    Sparse fieldsets for task lists, switching to TasksListFastSerializer
+    and values() rows when settings.TASK_LIST_FAST_SERIALIZER is enabled.
+    """
+
+    def get_serializer_class(self):
+        if settings.TASK_LIST_FAST_SERIALIZER:
+            return TasksListFastSerializer
+        return super().get_serializer_class()
+
+    def apply_sparse_fields(self, queryset, prefetches=()):
+        if settings.TASK_LIST_FAST_SERIALIZER:
+            # Tag IDs are fetched by the serializer in one grouped query
+            return queryset.values(*TasksListFastSerializer.get_columns(self.get_sparse_fields()))
+        return super().apply_sparse_fields(queryset, prefetches)
+
+
 """
 Task CRUD Views
 """
@@ -32,72 +125,90 @@ class CreateTaskView(generics.CreateAPIView):
     
     def perform_create(self, serializer):
         """Override to invalidate cache after creating a task."""
-        serializer.save()
-        self._invalidate_task_cache()
-    
-    def _invalidate_task_cache(self):
-        """Invalidate all task list caches for the current user."""
-        user_id = self.request.user.id
-        cache.delete(f'tasks_all_user_{user_id}')
-        cache.delete(f'tasks_active_user_{user_id}')
-        cache.delete(f'tasks_completed_user_{user_id}')
+        with transaction.atomic():
+            task = serializer.save()
+            record_changes(task.user_id, TASK, [task.id])
+            record_changes(task.user_id, SUBTASK, task.subtasks.values_list('id', flat=True))
+        invalidate_user_task_cache(self.request.user.id)
+        invalidate_calendar_density(task.user_id, [task.due_date])
     
     
-class ListTasksView(generics.ListAPIView):
+class ListTasksView(TaskListSerializerMixin, generics.ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = TasksListSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = TaskFilter
+    pagination_class = TaskKeysetPagination
     
     def get_queryset(self):
         """
         Return tasks for the current user.
         Excludes recurring task instances by default unless filtered.
+        Only the columns and relations of the requested fields are loaded.
         """
-        return Task.objects.filter(
+        queryset = Task.objects.filter(
             user=self.request.user,
             parent_recurring_task__isnull=True
-        ).select_related('category', 'recurrence_rule').prefetch_related('tags', 'subtasks')
+        )
+        return self.apply_sparse_fields(queryset, prefetches=[('tags', tag_ids_prefetch())])
     
     def list(self, request, *args, **kwargs):
         """
-        Override list method to implement caching for common filter patterns.
-        Cache keys are based on user ID and filter parameters.
+        Override list method to cache every filter combination.
+        Cache keys are based on user ID, the user's cache generation and
+        the normalized filter parameters, so any write invalidates them all.
+
+        The cache holds the final rendered (and compressed) JSON body, so a
+        hit is answered without running the serializer or the renderer, and
+        the cache key doubles as the ETag so conditional requests get a 304
+        before the cache entry is even read.
         """
-        # Get filter parameters
-        is_completed = request.query_params.get('is_completed', None)
-        search = request.query_params.get('search', None)
-        category = request.query_params.get('category', None)
-        tag = request.query_params.get('tag', None)
-        priority = request.query_params.get('priority', None)
-        
-        # Only cache if no complex filters (search, category, tag, priority)
-        # Cache common cases: all tasks, active tasks, completed tasks
-        should_cache = not any([search, category, tag, priority])
-        
-        if should_cache:
-            # Generate cache key based on user and completion status
-            if is_completed is None:
-                cache_key = f'tasks_all_user_{request.user.id}'
-            elif is_completed in ['true', 'True', '1', True]:
-                cache_key = f'tasks_completed_user_{request.user.id}'
-            else:
-                cache_key = f'tasks_active_user_{request.user.id}'
-            
-            # Try to get from cache
-            cached_data = cache.get(cache_key)
-            if cached_data is not None:
-                return Response(cached_data)
-        
-        # If not in cache or shouldn't cache, get from database
+        filterset = self.filterset_class(
+            request.query_params,
+            queryset=Task.objects.none(),
+            request=request,
+        )
+        params = normalize_filter_params(filterset)
+
+        # Invalid filters are reported by the filter backend as usual, and
+        # only JSON is cached (not the browsable API)
+        if params is None or request.accepted_renderer.format != 'json':
+            return super().list(request, *args, **kwargs)
+
+        # Every page and every projection is cached on its own
+        params.update(self.paginator.get_cache_params(request))
+        sparse_fields = self.get_sparse_fields()
+        if sparse_fields is not None:
+            params['fields'] = list(sparse_fields)
+
+        generation, last_modified = get_task_cache_state(request.user.id)
+        cache_key = make_task_list_cache_key(request.user.id, params, generation)
+        etag = make_etag(cache_key)
+        _, window_start = get_task_list_window(request.user.id)
+        last_modified = max(last_modified, window_start)
+
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        # Try to get from cache
+        cached_entry = cache.get(cache_key)
+        if cached_entry is not None:
+            response = build_cached_response(cached_entry, request)
+            return patch_conditional_headers(response, etag, last_modified)
+
+        # If not in cache, get from database
         response = super().list(request, *args, **kwargs)
-        
-        # Cache the response data for 5 minutes
-        if should_cache and response.status_code == 200:
-            cache.set(cache_key, response.data, timeout=300)  # 5 minutes
-        
-        return response
 
+        # Cache the rendered body for 5 minutes
+        if response.status_code == 200:
+            response = self.finalize_response(request, response, *args, **kwargs)
+            response.render()
+            entry = make_cached_response(response.content, response['Content-Type'], etag)
+            cache.set(cache_key, entry, timeout=TASK_LIST_CACHE_TIMEOUT)
+            patch_conditional_headers(response, etag, last_modified)
+
+        return response
 
 
 class TaskDetailView(generics.RetrieveAPIView):
@@ -113,20 +224,26 @@ class UpdateTaskView(generics.UpdateAPIView):
     
     def perform_update(self, serializer):
         """Override to invalidate cache after updating a task."""
-        serializer.save()
-        self._invalidate_task_cache()
-    
-    def _invalidate_task_cache(self):
-        """Invalidate all task list caches for the current user."""
-        user_id = self.request.user.id
-        cache.delete(f'tasks_all_user_{user_id}')
-        cache.delete(f'tasks_active_user_{user_id}')
-        cache.delete(f'tasks_completed_user_{user_id}')
+        previous_due_date = serializer.instance.due_date
+        with transaction.atomic():
+            # An edited recurring instance stops inheriting from its template
+            subtasks = detach_instances([serializer.instance])
+            task = serializer.save()
+            changed = [task.id]
+            if task.is_recurring and 'tags' in serializer.validated_data:
+                # Instances inheriting the template's tags changed too
+                changed += get_inheriting_instance_ids([task.id])
+            record_changes(task.user_id, TASK, changed)
+            record_changes(task.user_id, SUBTASK, [subtask.id for subtask in subtasks])
+            schedule_reminders([task])
+        invalidate_user_task_cache(self.request.user.id)
+        invalidate_calendar_density(task.user_id, [previous_due_date, task.due_date])
 
 
 class ToggleTaskCompletion(APIView):
     permission_classes = [IsAuthenticated]
 
+    @transaction.atomic
     def patch(self, request, pk):
         try:
             task = Task.objects.get(id=pk, user=request.user)
@@ -136,7 +253,7 @@ class ToggleTaskCompletion(APIView):
         # Store previous state to determine if completing or uncompleting
         was_completed = task.is_completed
         task.is_completed = not task.is_completed
-        task.save()
+        task.save(update_fields=['is_completed', 'updated_at'])
 
         karma_points = self.calculate_karma_for_task(task=task)
         
@@ -152,29 +269,165 @@ class ToggleTaskCompletion(APIView):
         cache.delete(cache_key)
         
         # Invalidate task list caches
-        self._invalidate_task_cache(request.user.id)
+        invalidate_user_task_cache(request.user.id)
+        invalidate_calendar_density(request.user.id, [task.due_date])
+        record_changes(request.user.id, TASK, [task.id])
+        # Completed tasks get no reminder, reopened ones get theirs back
+        schedule_reminders([task])
 
         return Response({
             'message': f'Task is {"completed" if task.is_completed else "reopened"}',
             'karma_change': karma_points if task.is_completed else -karma_points
         })
     
-    def _invalidate_task_cache(self, user_id):
-        """Invalidate all task list caches for the given user."""
-        cache.delete(f'tasks_all_user_{user_id}')
-        cache.delete(f'tasks_active_user_{user_id}')
-        cache.delete(f'tasks_completed_user_{user_id}')
-    
     def calculate_karma_for_task(self, task):
-        
-        karma_map = {
-            'low': 5,
-            'medium': 10,
-            'important': 15,
-            'very_important': 20,
-            'extremely_important': 25
-        }
-        return karma_map.get(task.priority, 10)
+        return TASK_KARMA.get(task.priority, 10)
+
+
+class BulkTaskView(APIView):
+    """
+    Create, update, toggle and delete many tasks in one request.
+
+    Operations run in order inside one transaction, with bulk_create,
+    bulk_update and filtered update()/delete() calls. Karma for all toggled
+    tasks goes into a single ledger entry, and caches are invalidated once.
+    """
+    permission_classes = [IsAuthenticated]
+
+    @transaction.atomic
+    def post(self, request):
+        serializer = BulkTaskSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        self.now = timezone.now()
+        # Old and new due dates of every written task
+        self.due_dates = []
+        karma_change = 0
+        result = {'created': [], 'updated': [], 'completed': [], 'reopened': [], 'deleted': []}
+        for operation in serializer.validated_data['operations']:
+            action = operation['action']
+            if action == 'create':
+                result['created'] += self.create_tasks(request.user, operation['tasks'])
+            elif action == 'update':
+                result['updated'] += self.update_tasks(request.user, operation['tasks'])
+            elif action == 'toggle':
+                completed, reopened, karma = self.toggle_tasks(request.user, operation['ids'])
+                result['completed'] += completed
+                result['reopened'] += reopened
+                karma_change += karma
+            else:
+                result['deleted'] += self.delete_tasks(request.user, operation['ids'])
+
+        if result['completed'] or result['reopened']:
+            award_karma_to_user(
+                request.user,
+                karma_change,
+                f'Bulk update: {len(result["completed"])} tasks completed, {len(result["reopened"])} reopened',
+            )
+            cache.delete(f'profile_info_user_{request.user.id}')
+
+        changed = set(result['created'] + result['updated'] + result['completed'] + result['reopened'])
+        record_changes(request.user.id, TASK, changed - set(result['deleted']))
+        invalidate_user_task_cache(request.user.id)
+        invalidate_calendar_density(request.user.id, self.due_dates)
+
+        result['karma_change'] = karma_change
+        return Response(result, status=status.HTTP_200_OK)
+
+    def set_tags(self, tags_by_task, replace=True):
+        """Set the tags of each task to the given tag IDs."""
+        through = Task.tags.through
+        if replace:
+            through.objects.filter(task_id__in=tags_by_task).delete()
+        through.objects.bulk_create([
+            through(task_id=task_id, tag_id=tag_id)
+            for task_id, tag_ids in tags_by_task.items()
+            for tag_id in set(tag_ids)
+        ])
+
+    def create_tasks(self, user, items):
+        tasks = []
+        for item in items:
+            fields = {name: value for name, value in item.items() if name not in ('category', 'tags')}
+            tasks.append(Task(user=user, category_id=item.get('category'), **fields))
+        Task.objects.bulk_create(tasks)
+        self.due_dates += [task.due_date for task in tasks]
+        schedule_reminders([task for task in tasks if task.reminder])
+
+        self.set_tags(
+            {task.id: item['tags'] for task, item in zip(tasks, items) if item.get('tags')},
+            replace=False,
+        )
+        return [task.id for task in tasks]
+
+    def update_tasks(self, user, items):
+        tasks = Task.objects.filter(user=user, id__in=[item['id'] for item in items]).in_bulk()
+        fields = {'updated_at'}
+        tags_by_task = {}
+        for item in items:
+            task = tasks.get(item['id'])
+            if task is None:
+                # Deleted by an earlier operation of the batch
+                continue
+            self.due_dates.append(task.due_date)
+            for name, value in item.items():
+                if name == 'id':
+                    continue
+                if name == 'tags':
+                    tags_by_task[task.id] = value
+                    continue
+                if name == 'category':
+                    name = 'category_id'
+                setattr(task, name, value)
+                fields.add(name)
+            task.updated_at = self.now
+            self.due_dates.append(task.due_date)
+
+        # Edited recurring instances stop inheriting from their template
+        subtasks = detach_instances(tasks.values())
+        Task.objects.bulk_update(tasks.values(), fields=sorted(fields))
+        self.set_tags(tags_by_task)
+        schedule_reminders(tasks.values())
+        record_changes(user.id, SUBTASK, [subtask.id for subtask in subtasks])
+
+        # Instances inheriting the tags of updated templates changed too
+        templates = [task_id for task_id in tags_by_task if tasks[task_id].is_recurring]
+        record_changes(user.id, TASK, get_inheriting_instance_ids(templates))
+        return list(tasks)
+
+    def toggle_tasks(self, user, ids):
+        """Flip completion with two filtered updates, returning the karma change."""
+        tasks = list(Task.objects.filter(user=user, id__in=ids).only(
+            'id', 'priority', 'is_completed', 'due_date', 'reminder', 'expired',
+        ))
+        completed = [task.id for task in tasks if not task.is_completed]
+        reopened = [task.id for task in tasks if task.is_completed]
+        self.due_dates += [task.due_date for task in tasks]
+
+        Task.objects.filter(id__in=completed).update(is_completed=True, updated_at=self.now)
+        Task.objects.filter(id__in=reopened).update(is_completed=False, updated_at=self.now)
+
+        karma = sum(
+            TASK_KARMA.get(task.priority, 10) * (-1 if task.is_completed else 1)
+            for task in tasks
+        )
+
+        for task in tasks:
+            task.is_completed = not task.is_completed
+        schedule_reminders(tasks)
+        return completed, reopened, karma
+
+    def delete_tasks(self, user, ids):
+        tasks = Task.objects.filter(user=user, id__in=ids)
+        deleted = []
+        for task_id, due_date in tasks.values_list('id', 'due_date'):
+            deleted.append(task_id)
+            self.due_dates.append(due_date)
+        # Recurring instances are deleted with their template
+        self.due_dates += Task.objects.filter(parent_recurring_task__in=deleted).values_list('due_date', flat=True)
+        record_task_deletions(tasks)
+        tasks.delete()
+        return deleted
 
 
 class DeleteTaskView(generics.DestroyAPIView):
@@ -189,30 +442,342 @@ class DeleteTaskView(generics.DestroyAPIView):
     def perform_destroy(self, instance):
         """Override to invalidate cache after deleting a task."""
         user_id = self.request.user.id
-        instance.delete()
-        self._invalidate_task_cache(user_id)
-    
-    def _invalidate_task_cache(self, user_id):
-        """Invalidate all task list caches for the given user."""
-        cache.delete(f'tasks_all_user_{user_id}')
-        cache.delete(f'tasks_active_user_{user_id}')
-        cache.delete(f'tasks_completed_user_{user_id}')
+        with transaction.atomic():
+            # Recurring instances are deleted with their template
+            due_dates = [instance.due_date]
+            due_dates += Task.objects.filter(parent_recurring_task=instance).values_list('due_date', flat=True)
+            record_task_deletions(Task.objects.filter(pk=instance.pk))
+            instance.delete()
+        invalidate_user_task_cache(user_id)
+        invalidate_calendar_density(instance.user_id, due_dates)
 
 
-class CalendarTasksView(generics.ListAPIView):
+class CalendarTasksView(TaskListSerializerMixin, generics.ListAPIView):
+    """
+    Tasks due between `start_date` and `end_date`, ordered by due date.
+
+    Recurring templates are expanded into virtual occurrences inside the
+    window, from their rule's next occurrence on, and merged with the real
+    tasks. Occurrences whose day already has a materialized instance are
+    skipped. Virtual rows are never saved: they carry the template's fields
+    with `id: null`, plus `recurring_task` (the template ID) and
+    `is_virtual: true`. Each page holds the virtual rows due up to its
+    last real task, so pages can be slightly larger than page_size.
+    """
     permission_classes = [IsAuthenticated]
     serializer_class = TasksListSerializer
+    pagination_class = CalendarKeysetPagination
+
+    def get_window(self):
+        if not hasattr(self, '_window'):
+            start = self.parse_bound(self.request.query_params.get('start_date'), 'start_date')
+            end = self.parse_bound(self.request.query_params.get('end_date'), 'end_date', end_of_day=True)
+            self._window = start, end
+        return self._window
+
+    def parse_bound(self, value, name, end_of_day=False):
+        """Parse an ISO datetime, or an ISO date meaning the start/end of that day."""
+        parsed = parse_datetime(value or '')
+        if parsed is None:
+            day = parse_date(value or '')
+            if day is None:
+                raise ValidationError({name: 'A valid ISO 8601 date or datetime is required'})
+            parsed = datetime.combine(day, time.max if end_of_day else time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
 
     def get_queryset(self):
-        start_date = self.request.query_params.get('start_date')
-        end_date = self.request.query_params.get('end_date')
+        start_date, end_date = self.get_window()
 
-        return Task.objects.filter(
+        queryset = Task.objects.filter(
             user=self.request.user,
             due_date__gte=start_date,
             due_date__lte=end_date,
             is_recurring=False
         ).order_by('due_date')
+        return self.apply_sparse_fields(queryset, prefetches=[
+            ('tags', tag_ids_prefetch()),
+            ('tags', inherited_tag_ids_prefetch()),
+        ])
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        data = self.get_serializer(page, many=True).data
+
+        # Window of this page: after the previous page's last due date,
+        # up to this page's last due date (or the window end on the last page)
+        start_date, end_date = self.get_window()
+        paginator = self.paginator
+        lower = paginator.position[0] if paginator.position else start_date
+        upper = self.get_due_date(page[-1]) if paginator.has_next else end_date
+
+        rows = [(self.get_due_date(row), 0, item) for row, item in zip(page, data)]
+        for due_date, item in self.get_virtual_occurrences(lower, upper):
+            if due_date > lower or (due_date == lower and not paginator.position):
+                rows.append((due_date, 1, item))
+        rows.sort(key=lambda row: row[:2])
+
+        return self.get_paginated_response([item for _, _, item in rows])
+
+    @staticmethod
+    def get_due_date(row):
+        return row['due_date'] if isinstance(row, dict) else row.due_date
+
+    def get_virtual_occurrences(self, lower, upper):
+        """
+        Return (due_date, data) pairs of the virtual occurrences of the
+        user's recurring templates due between lower and upper.
+        """
+        templates = list(
+            Task.objects.filter(
+                user=self.request.user,
+                is_recurring=True,
+                parent_recurring_task__isnull=True,
+                due_date__isnull=False,
+                recurrence_rule__next_occurance__lte=upper,
+            ).select_related('recurrence_rule').prefetch_related(tag_ids_prefetch())
+        )
+        if not templates:
+            return []
+
+        # Days that already have a materialized instance
+        materialized = {
+            (template_id, due_date.astimezone(dt_timezone.utc).date())
+            for template_id, due_date in Task.objects.filter(
+                parent_recurring_task__in=templates,
+                due_date__gte=lower - timedelta(days=1),
+                due_date__lte=upper,
+            ).values_list('parent_recurring_task_id', 'due_date')
+        }
+
+        context = {'sparse_fields': self.get_sparse_fields()}
+        template_data = TasksListSerializer(templates, many=True, context=context).data
+        to_representation = DateTimeField().to_representation
+        now = timezone.now()
+        # Older missed occurrences are not caught up by the recurrence job
+        catch_up_start = now - RECURRENCE_CATCH_UP
+
+        occurrences = []
+        for template, data in zip(templates, template_data):
+            for occurrence in template.recurrence_rule.iter_occurrences(upper):
+                due_date = get_occurrence_due_date(template, occurrence)
+                day = due_date.date()
+                if occurrence < catch_up_start or due_date < lower or due_date > upper or (template.id, day) in materialized:
+                    continue
+
+                item = dict(data)
+                overrides = {
+                    'id': None,
+                    'due_date': to_representation(due_date),
+                    'is_completed': False,
+                    'subtasks_completion_percentage': 0,
+                    'is_overdue': now > due_date,
+                }
+                item.update((name, value) for name, value in overrides.items() if name in item)
+                item['recurring_task'] = template.id
+                item['is_virtual'] = True
+                occurrences.append((due_date, item))
+        return occurrences
+
+
+class CalendarDensityView(APIView):
+    """
+    Per-day task counts for the calendar grid: total, completed, overdue
+    and per priority, for a `month` (YYYY-MM) or for `start_date` to
+    `end_date` (ISO dates, e.g. a week). Every day of the range is listed.
+
+    Each month is counted with one grouped query and cached per
+    (user, month) until a task due in that month changes. Overdue counts
+    depend on the current time, so they are derived from the cached counts
+    when the response is built. Only real tasks are counted, not the
+    virtual occurrences of recurring templates.
+    """
+    permission_classes = [IsAuthenticated]
+    max_days = 92
+
+    def get(self, request):
+        start, end = self.get_range(request.query_params)
+        user_id = request.user.id
+
+        months = []
+        month = start.replace(day=1)
+        while month <= end:
+            months.append(month)
+            month = self.next_month(month)
+
+        versions = get_calendar_density_versions(user_id, months)
+        keys = {
+            month: make_calendar_density_cache_key(user_id, month, version)
+            for month, version in versions.items()
+        }
+        cached = cache.get_many(keys.values())
+
+        buckets = {}
+        for month, key in keys.items():
+            month_buckets = cached.get(key)
+            if month_buckets is None:
+                month_buckets = self.count_month(user_id, month)
+                cache.set(key, month_buckets, timeout=CALENDAR_DENSITY_CACHE_TIMEOUT)
+            buckets.update(month_buckets)
+
+        now = timezone.localtime()
+        today = now.date()
+        empty = {'total': 0, 'completed': 0, 'by_priority': dict.fromkeys(self.get_priorities(), 0)}
+
+        days = []
+        day = start
+        while day <= end:
+            bucket = buckets.get(day.isoformat(), empty)
+            pending = bucket['total'] - bucket['completed']
+            if day < today:
+                overdue = pending
+            elif day == today and pending:
+                overdue = self.count_overdue_today(user_id, now)
+            else:
+                overdue = 0
+            days.append({
+                'date': day.isoformat(),
+                'total': bucket['total'],
+                'completed': bucket['completed'],
+                'overdue': overdue,
+                'by_priority': bucket['by_priority'],
+            })
+            day += timedelta(days=1)
+
+        return Response({
+            'start_date': start.isoformat(),
+            'end_date': end.isoformat(),
+            'days': days,
+        })
+
+    def get_range(self, params):
+        """Return the (first, last) day requested, both included."""
+        if params.get('month'):
+            try:
+                start = datetime.strptime(params['month'], '%Y-%m').date()
+            except ValueError:
+                raise ValidationError({'month': 'A month in YYYY-MM format is required'})
+            return start, self.next_month(start) - timedelta(days=1)
+
+        start = self.parse_day(params.get('start_date'), 'start_date')
+        end = self.parse_day(params.get('end_date'), 'end_date')
+        if end < start:
+            raise ValidationError({'end_date': 'end_date must not be before start_date'})
+        if (end - start).days >= self.max_days:
+            raise ValidationError({'end_date': f'The range can span at most {self.max_days} days'})
+        return start, end
+
+    def parse_day(self, value, name):
+        try:
+            day = parse_date(value or '')
+        except ValueError:
+            day = None
+        if day is None:
+            raise ValidationError({name: 'A valid ISO 8601 date is required'})
+        return day
+
+    @staticmethod
+    def next_month(month):
+        return (month.replace(day=1) + timedelta(days=32)).replace(day=1)
+
+    @staticmethod
+    def get_priorities():
+        return [priority for priority, _ in Task.PRIORITY_CHOICES]
+
+    def count_month(self, user_id, month):
+        """
+        Count the user's tasks due in a month, grouped by (local) day.
+        Returns {iso_day: bucket} for the days that have tasks.
+        """
+        priorities = self.get_priorities()
+        rows = Task.objects.filter(
+            user_id=user_id,
+            is_recurring=False,
+            due_date__gte=timezone.make_aware(datetime.combine(month, time.min)),
+            due_date__lt=timezone.make_aware(datetime.combine(self.next_month(month), time.min)),
+        ).annotate(day=TruncDate('due_date')).values('day').annotate(
+            total=Count('id'),
+            completed=Count('id', filter=Q(is_completed=True)),
+            **{
+                f'priority_{priority}': Count('id', filter=Q(priority=priority))
+                for priority in priorities
+            },
+        ).order_by()
+
+        return {
+            row['day'].isoformat(): {
+                'total': row['total'],
+                'completed': row['completed'],
+                'by_priority': {priority: row[f'priority_{priority}'] for priority in priorities},
+            }
+            for row in rows
+        }
+
+    def count_overdue_today(self, user_id, now):
+        return Task.objects.filter(
+            user_id=user_id,
+            is_recurring=False,
+            is_completed=False,
+            due_date__gte=now.replace(hour=0, minute=0, second=0, microsecond=0),
+            due_date__lt=now,
+        ).count()
+
+
+class TaskChangesView(APIView):
+    """
+    Delta sync: return the tasks, subtasks, tags and categories created,
+    updated or deleted since the `since` token, plus the token to send next.
+
+    Without `since` only the current token is returned: fetch it first,
+    then load the full lists, then poll with the token. A 410 means the
+    token is too old and the lists have to be loaded again.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        user_id = request.user.id
+        token = request.query_params.get('since')
+        if not token:
+            return Response({'token': encode_sync_token(get_current_seq(user_id))})
+
+        since, issued_at = decode_sync_token(token)
+        if is_token_expired(issued_at):
+            return Response(
+                {'error': 'Sync token expired, reload the full lists'},
+                status=status.HTTP_410_GONE,
+            )
+
+        changes, has_more = get_changes(user_id, since)
+        updated = {TASK: [], SUBTASK: [], TAG: [], CATEGORY: []}
+        deleted = {TASK: [], SUBTASK: [], TAG: [], CATEGORY: []}
+        for change in changes:
+            (deleted if change.deleted else updated)[change.kind].append(change.object_id)
+
+        tasks = Task.objects.filter(user_id=user_id, id__in=updated[TASK]).prefetch_related(
+            tag_ids_prefetch(),
+            inherited_tag_ids_prefetch(),
+        )
+        subtasks = SubTask.objects.filter(parent_task__user_id=user_id, id__in=updated[SUBTASK])
+        tags = Tag.objects.filter(owner_id=user_id, id__in=updated[TAG])
+        categories = Category.objects.filter(owner_id=user_id, id__in=updated[CATEGORY])
+
+        seq = changes[-1].seq if changes else since
+        return Response({
+            'token': encode_sync_token(seq, issued_at if has_more else None),
+            'has_more': has_more,
+            'tasks': TasksListSerializer(tasks, many=True).data,
+            'subtasks': SubtaskSerializer(subtasks, many=True).data,
+            'tags': TagSerializer(tags, many=True).data,
+            'categories': CategorySerializer(categories, many=True).data,
+            'deleted': {
+                'tasks': deleted[TASK],
+                'subtasks': deleted[SUBTASK],
+                'tags': deleted[TAG],
+                'categories': deleted[CATEGORY],
+            },
+        })
 
 
 """
@@ -222,49 +787,108 @@ Subtasks CRUD Views
 class SubtaskToggleView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @transaction.atomic
     def patch(self, request, pk):
         try:
-            subtask = SubTask.objects.get(id=pk)
+            subtask = SubTask.objects.select_for_update(of=('self',)).select_related('parent_task').get(id=pk)
         except SubTask.DoesNotExist:
             return Response({'error':'Subtask not found'}, status=404)
         
-        if subtask.parent_task.user != request.user:
+        task = subtask.parent_task
+        if task.user_id != request.user.id:
             return Response({'error':'Not authorized'}, status=403)
         
-        subtask.is_completed = not subtask.is_completed
-        subtask.save()
+        if not subtask.toggle():
+            return Response({'error':'Subtask was changed by another request, try again'}, status=409)
 
-        if subtask.is_completed:
-            award_karma_to_user(user=subtask.parent_task.user, amount=5, reason='subtask completed')
+        record_changes(request.user.id, SUBTASK, [subtask.id])
+        return self.toggled(request, task, subtask, subtask.is_completed)
+
+    def toggled(self, request, task, subtask, is_completed):
+        """Award karma, invalidate and respond after a successful toggle."""
+        if is_completed:
+            award_karma_to_user(user=request.user, amount=5, reason='subtask completed')
 
         # Invalidate task list caches since subtask changes affect task list
-        self._invalidate_task_cache(subtask.parent_task.user.id)
+        invalidate_user_task_cache(request.user.id)
+        record_changes(request.user.id, TASK, [task.id])
 
-        if subtask.parent_task.check_all_subtasks_completion():
-            award_karma_to_user(user=subtask.parent_task.user, amount=50, reason=f'All subtasks for {subtask.parent_task} has been completed')
+        if is_completed:
+            # Counters were updated in the database, reload just those
+            task.refresh_from_db(fields=['subtasks_total', 'subtasks_completed'])
+            if task.check_all_subtasks_completion():
+                award_karma_to_user(user=request.user, amount=50, reason=f'All subtasks for {task} has been completed')
         
         return Response({
             'id': subtask.id,
             'title': subtask.title,
-            'is_completed': subtask.is_completed,
+            'is_completed': is_completed,
             'message': 'Subtask updated successfully'
         })
-    
-    def _invalidate_task_cache(self, user_id):
-        """Invalidate all task list caches for the given user."""
-        cache.delete(f'tasks_all_user_{user_id}')
-        cache.delete(f'tasks_active_user_{user_id}')
-        cache.delete(f'tasks_completed_user_{user_id}')
+
+
+class InstanceSubtaskToggleView(SubtaskToggleView):
+    """
+    Toggle a subtask as shown on a task. Recurring instances that inherit
+    their template's subtasks list the template's subtask IDs, their
+    completion is stored per instance in SubTaskCompletion.
+    """
+
+    @transaction.atomic
+    def patch(self, request, task_pk, pk):
+        try:
+            task = Task.objects.get(id=task_pk, user=request.user)
+        except Task.DoesNotExist:
+            return Response({'error':'Task not found'}, status=404)
+
+        if not task.inherits_template:
+            if not SubTask.objects.filter(id=pk, parent_task=task).exists():
+                return Response({'error':'Subtask not found'}, status=404)
+            return super().patch(request, pk)
+
+        try:
+            subtask = SubTask.objects.get(id=pk, parent_task_id=task.parent_recurring_task_id)
+        except SubTask.DoesNotExist:
+            return Response({'error':'Subtask not found'}, status=404)
+
+        is_completed = task.toggle_inherited_subtask(subtask)
+        if is_completed is None:
+            return Response({'error':'Subtask was changed by another request, try again'}, status=409)
+        return self.toggled(request, task, subtask, is_completed)
+
+
 """
 Tags & Category CRUD Views
 """
 
-class CategoryListView(generics.ListAPIView):
+class ConditionalListMixin:
+    """
+    Answer conditional GETs of a per-user list from the user's task cache
+    generation, which every task, subtask, tag and category write bumps.
+    """
+    etag_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        generation, last_modified = get_task_cache_state(request.user.id)
+        etag = make_etag(self.etag_namespace, request.user.id, generation)
+
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
+        response = super().list(request, *args, **kwargs)
+        if response.status_code == 200:
+            patch_conditional_headers(response, etag, last_modified)
+        return response
+
+
+class CategoryListView(ConditionalListMixin, generics.ListAPIView):
     """
     List all categories for the authenticated user.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = CategorySerializer
+    etag_namespace = 'categories'
 
     def get_queryset(self):
         user = self.request.user
@@ -278,7 +902,10 @@ class CategoryCreateView(generics.CreateAPIView):
     serializer_class = CategorySerializer
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        with transaction.atomic():
+            category = serializer.save(owner=self.request.user)
+            record_changes(self.request.user.id, CATEGORY, [category.id])
+        invalidate_user_task_cache(self.request.user.id)
 
 class CategoryDetailView(generics.RetrieveAPIView):
     """
@@ -301,6 +928,12 @@ class CategoryUpdateView(generics.UpdateAPIView):
     def get_queryset(self):
         user = self.request.user
         return Category.objects.filter(owner=user)
+
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            category = serializer.save()
+            record_changes(self.request.user.id, CATEGORY, [category.id])
+        invalidate_user_task_cache(self.request.user.id)
     
 class CategoryDeleteView(generics.DestroyAPIView):
     """
@@ -312,6 +945,15 @@ class CategoryDeleteView(generics.DestroyAPIView):
     def get_queryset(self):
         user = self.request.user
         return Category.objects.filter(owner=user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Tasks of the category lose it (SET_NULL)
+            task_ids = Task.objects.filter(category=instance).values_list('id', flat=True)
+            record_changes(self.request.user.id, TASK, task_ids)
+            record_changes(self.request.user.id, CATEGORY, [instance.id], deleted=True)
+            instance.delete()
+        invalidate_user_task_cache(self.request.user.id)
     
 class TagDeleteView(generics.DestroyAPIView):
     """
@@ -323,6 +965,17 @@ class TagDeleteView(generics.DestroyAPIView):
     def get_queryset(self):
         user = self.request.user
         return Tag.objects.filter(owner=user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            # Tasks with the tag lose it, so do instances inheriting it
+            task_ids = Task.objects.filter(
+                Q(tags=instance) | Q(inherits_template=True, parent_recurring_task__tags=instance)
+            ).values_list('id', flat=True)
+            record_changes(self.request.user.id, TASK, task_ids)
+            record_changes(self.request.user.id, TAG, [instance.id], deleted=True)
+            instance.delete()
+        invalidate_user_task_cache(self.request.user.id)
     
 class TagUpdateView(generics.UpdateAPIView):
     """
@@ -335,6 +988,12 @@ class TagUpdateView(generics.UpdateAPIView):
         user = self.request.user
         return Tag.objects.filter(owner=user)
 
+    def perform_update(self, serializer):
+        with transaction.atomic():
+            tag = serializer.save()
+            record_changes(self.request.user.id, TAG, [tag.id])
+        invalidate_user_task_cache(self.request.user.id)
+
 class TagDetailView(generics.RetrieveAPIView):
     """
     Retrieve details of a specific tag by ID for the authenticated user.
@@ -354,14 +1013,18 @@ class TagCreateView(generics.CreateAPIView):
     serializer_class = TagSerializer
 
     def perform_create(self, serializer):
-        serializer.save(owner=self.request.user)
+        with transaction.atomic():
+            tag = serializer.save(owner=self.request.user)
+            record_changes(self.request.user.id, TAG, [tag.id])
+        invalidate_user_task_cache(self.request.user.id)
     
-class TagListView(generics.ListAPIView):
+class TagListView(ConditionalListMixin, generics.ListAPIView):
     """
     List all tags for the authenticated user.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = TagSerializer
+    etag_namespace = 'tags'
 
     def get_queryset(self):
         user = self.request.user
@@ -0,0 +1,162 @@
+"""
+Badge award engine.
+
+The badge tiers (Badges rows) almost never change, so every process keeps
+them in a local table sorted by karma_min and computes the badges a karma
+amount has earned in memory. Saving or deleting a Badges row bumps a
+version in the cache; processes compare it with the version of their table
+at most every BADGE_TIERS_RECHECK seconds and reload when it moved.
+
+Read endpoints use get_badge_tier to find a user's current tier by binary
+search over the same table.
+
+A karma change only writes when it crosses a tier boundary. The earned
+badges are then inserted with one bulk_create that ignores the ones the
+user already has (UserBadge is unique on user and badge).
+"""
+import time
+from bisect import bisect_right
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .models import Badges, MyUser, UserBadge
+
+
+BADGE_TIERS_VERSION_KEY = 'badges:tiers_version'
+
+# Seconds a process trusts its tier table without checking the version
+BADGE_TIERS_RECHECK = 30
+
+# Users per query when awarding badges in bulk
+BADGE_BATCH_SIZE = 1000
+
+_tiers = None
+_tier_mins = []
+_tiers_version = None
+_tiers_checked_at = 0
+
+
+def _get_version():
+    version = cache.get(BADGE_TIERS_VERSION_KEY)
+    if version is None:
+        cache.add(BADGE_TIERS_VERSION_KEY, 1, timeout=None)
+        version = cache.get(BADGE_TIERS_VERSION_KEY)
+    return version
+
+
+def get_badge_tiers():
+    """Return the badges sorted by karma_min, from the process-local table."""
+    global _tiers, _tier_mins, _tiers_version, _tiers_checked_at
+
+    now = time.monotonic()
+    if _tiers is not None and now - _tiers_checked_at < BADGE_TIERS_RECHECK:
+        return _tiers
+
+    version = _get_version()
+    if _tiers is None or version != _tiers_version:
+        _tiers = list(Badges.objects.order_by('karma_min', 'id'))
+        _tier_mins = [badge.karma_min for badge in _tiers]
+        _tiers_version = version
+    _tiers_checked_at = now
+    return _tiers
+
+
+def _bump_version():
+    global _tiers
+    _tiers = None
+    try:
+        cache.incr(BADGE_TIERS_VERSION_KEY)
+    except ValueError:
+        cache.add(BADGE_TIERS_VERSION_KEY, 1, timeout=None)
+
+
+def invalidate_badge_tiers():
+    """Make every process reload the tier table once the transaction commits."""
+    transaction.on_commit(_bump_version)
+
+
+def get_badge_tier(karma):
+    """Return the badge whose karma range contains `karma`, or None."""
+    tiers = get_badge_tiers()
+    index = bisect_right(_tier_mins, karma) - 1
+    if index >= 0 and karma <= tiers[index].karma_max:
+        return tiers[index]
+    return None
+
+
+def get_tier_progress(badge, karma):
+    """Progress of `karma` through the range of its tier `badge`."""
+    if badge.karma_max > badge.karma_min:
+        percentage = round(((karma - badge.karma_min) / (badge.karma_max - badge.karma_min)) * 100, 2)
+    else:
+        percentage = 100
+    return {
+        'percentage': percentage,
+        'karma_to_next_level': max(0, badge.karma_max + 1 - karma),
+    }
+
+
+def get_earned_badge_ids(karma):
+    """
+    IDs of the badges a user with this karma has earned: every tier whose
+    range ends at or below it and the tier it falls in.
+    """
+    earned = []
+    current = None
+    for badge in get_badge_tiers():
+        if badge.karma_min > karma:
+            break
+        if badge.karma_max <= karma:
+            earned.append(badge.id)
+        elif current is None:
+            current = badge.id
+    if current is not None:
+        earned.append(current)
+    return earned
+
+
+def award_badges(user_id, karma, old_karma=None):
+    """
+    Insert the badges earned with `karma` that the user does not have yet.
+    With `old_karma` nothing is done unless the change reached a new tier.
+    """
+    earned = get_earned_badge_ids(karma)
+    if old_karma is not None and set(earned) <= set(get_earned_badge_ids(old_karma)):
+        return
+    UserBadge.objects.bulk_create(
+        [UserBadge(user_id=user_id, badge_id=badge_id) for badge_id in earned],
+        ignore_conflicts=True,
+    )
+
+
+def award_badges_in_bulk(users, batch_size=BADGE_BATCH_SIZE):
+    """
+    Award the earned badges of many users, given as (user_id, karma)
+    pairs, with one insert per batch. Returns the number of users.
+    """
+    total = 0
+    batch = []
+    for user_id, karma in users:
+        batch += [UserBadge(user_id=user_id, badge_id=badge_id) for badge_id in get_earned_badge_ids(karma)]
+        total += 1
+        if total % batch_size == 0:
+            UserBadge.objects.bulk_create(batch, ignore_conflicts=True)
+            batch = []
+    if batch:
+        UserBadge.objects.bulk_create(batch, ignore_conflicts=True)
+    return total
+
+
+def reconcile_badges(user_ids=None, batch_size=BADGE_BATCH_SIZE):
+    """
+    Award every user (or the given users) all the badges their karma has
+    earned. Returns the number of users checked.
+    """
+    users = MyUser.objects.order_by('id')
+    if user_ids is not None:
+        users = users.filter(id__in=list(user_ids))
+    return award_badges_in_bulk(
+        users.values_list('id', 'karma').iterator(chunk_size=batch_size),
+        batch_size=batch_size,
+    )
@@ -0,0 +1,245 @@
+"""
+Karma leaderboard.
+
+Active users are kept in a Redis sorted set (LEADERBOARD_KEY): members are
+user IDs, scores their karma. Karma writes update it once they commit
+(update_leaderboard), so the leaderboard view reads the top of the board,
+a user's rank and the users around them in O(log n) without touching the
+user table.
+
+The database stays the source of truth. The board can be rebuilt from it
+at any time (rebuild_leaderboard, or the rebuild_leaderboard command). If
+Redis lost it, the ensure_leaderboards beat job rebuilds it and the view
+reads from the user table meanwhile. A rebuild holds a Redis lock, so the
+same board is never rebuilt twice at once.
+
+The weekly and monthly boards (LEADERBOARD_WINDOWS) are sorted sets of the
+karma earned over the last days, summed from the daily rollup (KarmaDaily).
+They are recomputed on a schedule (compute_window_leaderboards) and read
+the same way, and are empty until their first computation.
+"""
+from datetime import timedelta
+from uuid import uuid4
+
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from .models import KarmaDaily, MyUser
+
+
+LEADERBOARD_KEY = 'users:leaderboard'
+
+# Present while the board holds every active user
+LEADERBOARD_BUILT_KEY = 'users:leaderboard:built'
+
+# Seconds a rebuild may hold the lock of its board
+LEADERBOARD_REBUILD_TIMEOUT = 600
+
+# Hard caps of the leaderboard view's ?limit= and ?around=
+LEADERBOARD_MAX_LIMIT = 100
+LEADERBOARD_MAX_AROUND = 10
+
+# Windowed boards and their length in days, today included
+LEADERBOARD_WINDOWS = {
+    'week': 7,
+    'month': 30,
+}
+
+
+def _update_board(scores, removed):
+    pipeline = get_redis_connection('default').pipeline()
+    if scores:
+        pipeline.zadd(LEADERBOARD_KEY, scores)
+    if removed:
+        pipeline.zrem(LEADERBOARD_KEY, *removed)
+    pipeline.execute()
+
+
+def update_leaderboard(scores):
+    """
+    Set the karma of the given users, a {user_id: karma} dict, on the board
+    once the current transaction commits. Only pass active users.
+    """
+    scores = {str(user_id): karma for user_id, karma in scores.items()}
+    if scores:
+        transaction.on_commit(lambda: _update_board(scores, []))
+
+
+def remove_from_leaderboard(user_id):
+    """Take a user off the board once the current transaction commits."""
+    transaction.on_commit(lambda: _update_board({}, [str(user_id)]))
+
+
+def _locked(key, rebuild):
+    """
+    Run rebuild() holding the rebuild lock of the board `key`. Returns its
+    result, or None without running it if another rebuild holds the lock.
+    """
+    lock = get_redis_connection('default').lock(f'{key}:lock', timeout=LEADERBOARD_REBUILD_TIMEOUT)
+    if not lock.acquire(blocking=False):
+        return None
+    try:
+        return rebuild()
+    finally:
+        lock.release()
+
+
+def _replace_board(key, scores, chunk_size):
+    """
+    Replace the sorted set `key` with the (user_id, score) pairs. The new
+    board is built under a temporary key of its own and swapped in at once,
+    so readers never see a partial board. Returns the number of members.
+    """
+    redis = get_redis_connection('default')
+    building_key = f'{key}:rebuild:{uuid4().hex}'
+
+    total = 0
+    batch = {}
+    for user_id, score in scores:
+        batch[str(user_id)] = score
+        if len(batch) >= chunk_size:
+            redis.zadd(building_key, batch)
+            total += len(batch)
+            batch = {}
+    if batch:
+        redis.zadd(building_key, batch)
+        total += len(batch)
+
+    if total:
+        redis.rename(building_key, key)
+    else:
+        redis.delete(key)
+    return total
+
+
+def rebuild_leaderboard(chunk_size=5000):
+    """
+    Rebuild the board from the karma of every active user. Returns the
+    number of users, or None if another rebuild is running.
+    """
+    def rebuild():
+        users = MyUser.objects.filter(is_active=True).values_list('id', 'karma')
+        total = _replace_board(LEADERBOARD_KEY, users.iterator(chunk_size=chunk_size), chunk_size)
+        get_redis_connection('default').set(LEADERBOARD_BUILT_KEY, 1)
+        return total
+    return _locked(LEADERBOARD_KEY, rebuild)
+
+
+def _positions(members, start=0):
+    return [(int(member), start + offset + 1, int(score)) for offset, (member, score) in enumerate(members)]
+
+
+def _get_database_leaderboard(user, limit):
+    """get_leaderboard from the user table, while the board is not built."""
+    users = MyUser.objects.filter(is_active=True)
+    top = users.order_by('-karma', 'id').values_list('id', 'karma')[:limit]
+    rank = users.filter(karma__gt=user.karma).count() + 1
+    return _positions(top), rank, []
+
+
+def get_leaderboard(user, limit, around):
+    """
+    Return (top, rank, nearby) for `user`:
+    - top: the (user_id, position, score) of the first `limit` users
+    - rank: 1 + the number of users with more karma than `user`
+    - nearby: the (user_id, position, score) of the `around` users above
+      and below `user`, `user` included
+    Until the board is built, top and rank come from the user table and
+    nearby is empty.
+    """
+    redis = get_redis_connection('default')
+    if not redis.exists(LEADERBOARD_BUILT_KEY):
+        return _get_database_leaderboard(user, limit)
+    member = str(user.id)
+
+    pipeline = redis.pipeline()
+    pipeline.zrevrange(LEADERBOARD_KEY, 0, limit - 1, withscores=True)
+    pipeline.zcount(LEADERBOARD_KEY, f'({user.karma}', '+inf')
+    pipeline.zrevrank(LEADERBOARD_KEY, member)
+    top, higher, position = pipeline.execute()
+
+    if position is None and user.is_active:
+        # Missing from the board (e.g. created by manage.py), add them now
+        redis.zadd(LEADERBOARD_KEY, {member: user.karma})
+        position = redis.zrevrank(LEADERBOARD_KEY, member)
+
+    nearby = []
+    if position is not None and around:
+        start = max(0, position - around)
+        nearby = _positions(redis.zrevrange(LEADERBOARD_KEY, start, position + around, withscores=True), start)
+
+    return _positions(top), higher + 1, nearby
+
+
+def get_window_key(window):
+    return f'{LEADERBOARD_KEY}:{window}'
+
+
+def compute_window_leaderboard(window, chunk_size=5000):
+    """
+    Recompute a windowed board from the daily karma rollup. Returns the
+    number of users on it, or None if another computation is running.
+    """
+    def rebuild():
+        start = timezone.localdate() - timedelta(days=LEADERBOARD_WINDOWS[window] - 1)
+        totals = (
+            KarmaDaily.objects.filter(day__gte=start, user__is_active=True)
+            .values_list('user_id')
+            .annotate(total=Sum('amount'))
+            .exclude(total=0)
+            .order_by()
+        )
+        total = _replace_board(get_window_key(window), totals.iterator(chunk_size=chunk_size), chunk_size)
+        get_redis_connection('default').set(f'{get_window_key(window)}:built', 1)
+        return total
+    return _locked(get_window_key(window), rebuild)
+
+
+def compute_window_leaderboards():
+    """Recompute every windowed board. Returns {window: number of users}."""
+    return {window: compute_window_leaderboard(window) for window in LEADERBOARD_WINDOWS}
+
+
+def ensure_leaderboards():
+    """
+    Rebuild the boards Redis lost (e.g. after a flush). Run by a beat job,
+    never by requests. Returns the names of the boards rebuilt.
+    """
+    redis = get_redis_connection('default')
+    rebuilt = []
+    if not redis.exists(LEADERBOARD_BUILT_KEY) and rebuild_leaderboard() is not None:
+        rebuilt.append('all')
+    for window in LEADERBOARD_WINDOWS:
+        if not redis.exists(f'{get_window_key(window)}:built') and compute_window_leaderboard(window) is not None:
+            rebuilt.append(window)
+    return rebuilt
+
+
+def get_window_leaderboard(user, window, limit, around):
+    """
+    Like get_leaderboard, for a windowed board. Also returns the karma
+    `user` earned in the window: (top, rank, nearby, karma). Users without
+    karma in the window have no rank (None).
+    """
+    redis = get_redis_connection('default')
+    key = get_window_key(window)
+    member = str(user.id)
+
+    pipeline = redis.pipeline()
+    pipeline.zrevrange(key, 0, limit - 1, withscores=True)
+    pipeline.zscore(key, member)
+    pipeline.zrevrank(key, member)
+    top, karma, position = pipeline.execute()
+
+    rank = None
+    if karma is not None:
+        rank = redis.zcount(key, f'({karma}', '+inf') + 1
+
+    nearby = []
+    if position is not None and around:
+        start = max(0, position - around)
+        nearby = _positions(redis.zrevrange(key, start, position + around, withscores=True), start)
+
+    return _positions(top), rank, nearby, int(karma or 0)
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from user.rollup import find_rollup_mismatches, rebuild_karma_rollup
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the daily karma rollup (KarmaDaily) from the karma ledger. '
+        'With --check, only compare them and fail on any difference.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Report the days where the rollup differs from the ledger instead of rebuilding',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = find_rollup_mismatches()
+            for user_id, day, ledger, rollup in mismatches:
+                self.stdout.write(f'user {user_id} {day}: ledger {ledger}, rollup {rollup}')
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} days differ from the ledger')
+            self.stdout.write(self.style.SUCCESS('Karma rollup matches the ledger'))
+            return
+
+        total = rebuild_karma_rollup()
+        self.stdout.write(self.style.SUCCESS(f'{total} daily karma rows rebuilt'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from user.leaderboard import rebuild_leaderboard
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the Redis karma leaderboard from the karma of every active '
+        'user. Safe to run at any time.'
+    )
+
+    def handle(self, *args, **options):
+        total = rebuild_leaderboard()
+        if total is None:
+            raise CommandError('Another rebuild of the leaderboard is running')
+        self.stdout.write(self.style.SUCCESS(f'{total} users on the leaderboard'))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from user.badges import BADGE_BATCH_SIZE, reconcile_badges
+
+
+class Command(BaseCommand):
+    help = (
+        'Award every user all the badges their karma has earned. '
+        'Badges users already have are left alone, safe to run at any time.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BADGE_BATCH_SIZE,
+            help=f'Number of users awarded per insert (default: {BADGE_BATCH_SIZE})',
+        )
+
+    def handle(self, *args, **options):
+        total = reconcile_badges(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Badges reconciled for {total} users'))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0004_myuser_profile_picture'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='evening_digest_sent_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='morning_digest_sent_on',
+            field=models.DateField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0005_myuser_digest_sent_on'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KarmaDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('amount', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='karma_days', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['day'], name='karma_daily_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'day'), name='karma_daily_user_day_unique')],
+            },
+        ),
+    ]
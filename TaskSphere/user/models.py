@@ -31,6 +31,9 @@ class MyUser(AbstractBaseUser):
     current_streak = models.PositiveSmallIntegerField(default=0)
     highest_streak = models.PositiveSmallIntegerField(default=0)
     karma = models.SmallIntegerField(default=0)
+    # Days the daily digests were last sent (claimed), see task.tasks
+    morning_digest_sent_on = models.DateField(blank=True, null=True)
+    evening_digest_sent_on = models.DateField(blank=True, null=True)
     otp_code = models.CharField(max_length=6, blank=True, null=True)
     otp_created_at = models.DateTimeField(blank=True, null=True)
     forgot_password_otp = models.CharField(max_length=6, blank=True, null=True)
@@ -59,6 +62,20 @@ class MyUser(AbstractBaseUser):
     def is_staff(self):
         return self.is_admin
 
+    # Only active users are on the leaderboard (see user.leaderboard)
+    def save(self, *args, **kwargs):
+        from .leaderboard import remove_from_leaderboard, update_leaderboard
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'is_active' not in update_fields:
+            return
+        if not self.is_active:
+            remove_from_leaderboard(self.id)
+        elif update_fields is None or 'karma' in update_fields:
+            update_leaderboard({self.id: self.karma})
+        else:
+            update_leaderboard({self.id: MyUser.objects.values_list('karma', flat=True).get(pk=self.pk)})
+
 
 class TemporaryUser(models.Model):
     username = models.CharField(max_length=100)
@@ -90,6 +107,18 @@ class Badges(models.Model):
     karma_min = models.PositiveIntegerField(default=0)
     karma_max = models.PositiveIntegerField(default=0)
 
+    # The badge engine keeps the tiers in memory (see user.badges)
+    def save(self, *args, **kwargs):
+        from .badges import invalidate_badge_tiers
+        super().save(*args, **kwargs)
+        invalidate_badge_tiers()
+
+    def delete(self, *args, **kwargs):
+        from .badges import invalidate_badge_tiers
+        result = super().delete(*args, **kwargs)
+        invalidate_badge_tiers()
+        return result
+
 
 class UserBadge(models.Model):
     user = models.ForeignKey(MyUser, on_delete=models.CASCADE, null=True, blank=True)
@@ -114,3 +143,25 @@ class KarmaTransaction(models.Model):
     
     def __str__(self):
         return f'{self.user.username} - {self.amount} karma - {self.reason}'
+
+
+class KarmaDaily(models.Model):
+    """
+    Net karma of one user on one (local) day: the sum of the day's
+    KarmaTransaction amounts, kept in sync by user.rollup. The weekly and
+    monthly leaderboards are computed from these rows.
+    """
+    user = models.ForeignKey(MyUser, on_delete=models.CASCADE, related_name='karma_days')
+    day = models.DateField()
+    amount = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'day'], name='karma_daily_user_day_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['day'], name='karma_daily_day_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id} - {self.day} - {self.amount}'
@@ -0,0 +1,93 @@
+"""
+Daily karma rollup.
+
+KarmaDaily holds the net karma of each user per (local) day. Every write
+of KarmaTransaction rows calls record_karma_rollup in the same
+transaction, so the rollup always equals the ledger summed per user and
+day: rows are created with ignore_conflicts and incremented with one
+UPDATE per (day, amount), which stays correct when several writers add
+to the same day at once.
+
+rebuild_karma_rollup recomputes the rollup from the ledger (after a
+backfill or a manual ledger edit), find_rollup_mismatches compares them.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import KarmaDaily, KarmaTransaction
+
+
+def record_karma_rollup(transactions):
+    """Add saved KarmaTransaction objects to the daily rollup."""
+    totals = defaultdict(int)
+    for karma_transaction in transactions:
+        day = timezone.localdate(karma_transaction.created_at)
+        totals[(karma_transaction.user_id, day)] += karma_transaction.amount
+    if not totals:
+        return
+
+    KarmaDaily.objects.bulk_create(
+        [KarmaDaily(user_id=user_id, day=day) for user_id, day in totals],
+        ignore_conflicts=True,
+        batch_size=1000,
+    )
+
+    # One UPDATE per (day, amount), streak jobs only have a handful
+    users = defaultdict(list)
+    for (user_id, day), amount in totals.items():
+        if amount:
+            users[(day, amount)].append(user_id)
+    for (day, amount), user_ids in users.items():
+        KarmaDaily.objects.filter(day=day, user_id__in=user_ids).update(amount=F('amount') + amount)
+
+
+def get_ledger_totals(users=None):
+    """(user_id, day, total) rows of the ledger, optionally for some users."""
+    ledger = KarmaTransaction.objects.all()
+    if users is not None:
+        ledger = ledger.filter(user_id__in=users)
+    return (
+        ledger.annotate(day=TruncDate('created_at'))
+        .values_list('user_id', 'day')
+        .annotate(total=Sum('amount'))
+        .order_by()
+    )
+
+
+def find_rollup_mismatches(users=None):
+    """
+    Return the (user_id, day, ledger total, rollup amount) rows where the
+    rollup differs from the ledger. Days without transactions count as 0.
+    """
+    ledger = {(user_id, day): total for user_id, day, total in get_ledger_totals(users)}
+    rollup = KarmaDaily.objects.all()
+    if users is not None:
+        rollup = rollup.filter(user_id__in=users)
+    rollup = {(user_id, day): amount for user_id, day, amount in rollup.values_list('user_id', 'day', 'amount')}
+
+    mismatches = []
+    for key in sorted(set(ledger) | set(rollup)):
+        if ledger.get(key, 0) != rollup.get(key, 0):
+            mismatches.append((*key, ledger.get(key, 0), rollup.get(key, 0)))
+    return mismatches
+
+
+def rebuild_karma_rollup(batch_size=5000):
+    """Recompute the whole rollup from the ledger. Returns the number of rows."""
+    total_rows = 0
+    with transaction.atomic():
+        KarmaDaily.objects.all().delete()
+        rows = []
+        for user_id, day, total in get_ledger_totals().iterator(chunk_size=batch_size):
+            rows.append(KarmaDaily(user_id=user_id, day=day, amount=total))
+            if len(rows) >= batch_size:
+                KarmaDaily.objects.bulk_create(rows)
+                total_rows += len(rows)
+                rows = []
+        KarmaDaily.objects.bulk_create(rows)
+        total_rows += len(rows)
+    return total_rows
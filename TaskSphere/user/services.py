@@ -1,5 +1,9 @@
 from random import randint
-from .models import Badges, UserBadge, KarmaTransaction
+from django.db import transaction
+from .badges import award_badges
+from .leaderboard import update_leaderboard
+from .rollup import record_karma_rollup
+from .models import KarmaTransaction, MyUser
 
 def generate_otp():
     otp = randint(100000,999999)
@@ -17,26 +21,7 @@ def assign_badge_based_on_karma(user):
     Assign all badges that the user has earned based on their total karma.
     Awards all badges from beginner up to their current karma level.
     """
-    user_karma_amount = user.karma
-
-    # Get all badges the user should have earned (all badges with max <= user's karma)
-    earned_badges = Badges.objects.filter(karma_max__lte=user_karma_amount)
-    
-    # Also include the current level badge
-    current_level_badge = Badges.objects.filter(
-        karma_min__lte=user_karma_amount,
-        karma_max__gte=user_karma_amount
-    ).first()
-    
-    # Collect all badges to award
-    badges_to_award = list(earned_badges)
-    if current_level_badge and current_level_badge not in badges_to_award:
-        badges_to_award.append(current_level_badge)
-    
-    # Award each badge if not already awarded
-    for badge in badges_to_award:
-        if not UserBadge.objects.filter(user=user, badge=badge).exists():
-            UserBadge.objects.create(user=user, badge=badge)
+    award_badges(user.id, user.karma)
 
 def award_karma_to_user(user, amount, reason=''):
     """
@@ -46,22 +31,25 @@ def award_karma_to_user(user, amount, reason=''):
     if amount == 0:
         return
 
-    user.karma += amount
-    
-    # Prevent negative karma
-    if user.karma < 0:
-        user.karma = 0
-    
-    user.save()
-    
-    # Track the transaction
-    KarmaTransaction.objects.create(
-        user=user,
-        amount=amount,
-        reason=reason
-    )
-
-    assign_badge_based_on_karma(user=user)
-
-     
-
+    # Lock the row and write the karma column only, so concurrent awards
+    # add up and the rest of the row (e.g. the digest markers) is left
+    # alone. Karma never goes below 0.
+    with transaction.atomic():
+        old_karma, is_active = MyUser.objects.select_for_update().values_list('karma', 'is_active').get(pk=user.pk)
+        user.karma = max(old_karma + amount, 0)
+        MyUser.objects.filter(pk=user.pk).update(karma=user.karma)
+
+        # Track the transaction, and its day in the rollup with it
+        karma_transaction = KarmaTransaction.objects.create(
+            user=user,
+            amount=amount,
+            reason=reason
+        )
+        record_karma_rollup([karma_transaction])
+
+    # Only writes when the change reached a new badge tier
+    award_badges(user.id, user.karma, old_karma=old_karma)
+
+    # Inactive users stay off the leaderboard
+    if is_active:
+        update_leaderboard({user.id: user.karma})
@@ -5,6 +5,7 @@ from django.core.mail import send_mail
 from django.conf import settings
 from django.utils import timezone
 
+from .leaderboard import compute_window_leaderboards, ensure_leaderboards
 from .models import TemporaryUser
 
 
@@ -50,3 +51,15 @@ def cleanup_expired_temporary_users():
     ).delete()[0]
     
     return f"Cleaned up {deleted_count} expired temporary user records"
+
+
+@shared_task
+def compute_windowed_leaderboards():
+    """Recompute the weekly and monthly leaderboards from the karma rollup."""
+    return compute_window_leaderboards()
+
+
+@shared_task
+def rebuild_lost_leaderboards():
+    """Rebuild the leaderboards Redis lost, see user.leaderboard."""
+    return ensure_leaderboards()
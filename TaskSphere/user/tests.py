@@ -0,0 +1,123 @@
+from datetime import date, datetime, timezone
+from io import StringIO
+from unittest import mock
+from zoneinfo import ZoneInfo
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase, override_settings
+
+from task.models import Task
+from task.tasks import calculate_user_streak_shard
+from .models import KarmaDaily, KarmaTransaction, MyUser
+from .rollup import find_rollup_mismatches
+from .services import award_karma_to_user
+
+
+CHICAGO = ZoneInfo('America/Chicago')
+
+
+def local_time(*args):
+    # In UTC, like timezone.now()
+    return datetime(*args, tzinfo=CHICAGO).astimezone(timezone.utc)
+
+
+@override_settings(TIME_ZONE='America/Chicago')
+class KarmaRollupTests(TestCase):
+    """KarmaDaily must always equal the ledger summed per user and local day."""
+
+    def setUp(self):
+        self.user = MyUser.objects.create(username='rollup', email='rollup@example.com')
+
+    def award(self, when, amount, user=None):
+        with mock.patch('django.utils.timezone.now', return_value=when):
+            award_karma_to_user(user or self.user, amount, 'test')
+
+    def get_rollup(self, user=None):
+        return dict(KarmaDaily.objects.filter(user=user or self.user).values_list('day', 'amount'))
+
+    def assertConsistent(self):
+        self.assertEqual(find_rollup_mismatches(), [])
+        call_command('rebuild_karma_rollup', check=True, stdout=StringIO())
+
+    def test_awards_and_penalties(self):
+        self.award(local_time(2026, 10, 16, 12), 50)
+        self.award(local_time(2026, 10, 16, 13), -20)
+        self.award(local_time(2026, 10, 16, 14), 5)
+
+        self.assertEqual(self.get_rollup(), {date(2026, 10, 16): 35})
+        self.assertConsistent()
+
+    def test_penalty_clamped_at_zero(self):
+        # Karma stops at 0, the ledger and the rollup keep the full amount
+        self.award(local_time(2026, 10, 16, 12), 30)
+        self.award(local_time(2026, 10, 16, 13), -100)
+
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.karma, 0)
+        self.assertEqual(self.get_rollup(), {date(2026, 10, 16): -70})
+        self.assertConsistent()
+
+    def test_local_day_boundaries(self):
+        # Both times fall on 2026-10-17 in UTC, but on two local days
+        self.award(local_time(2026, 10, 16, 23, 59, 59), 10)
+        self.award(local_time(2026, 10, 17, 0, 0, 1), 20)
+        # Local midnight itself belongs to the new day
+        self.award(local_time(2026, 10, 18), 40)
+
+        self.assertEqual(self.get_rollup(), {
+            date(2026, 10, 16): 10,
+            date(2026, 10, 17): 20,
+            date(2026, 10, 18): 40,
+        })
+        self.assertConsistent()
+
+    def test_streak_job_bulk_insert(self):
+        users = [self.user] + [
+            MyUser.objects.create(username=f'streak{i}', email=f'streak{i}@example.com', current_streak=streak)
+            for i, streak in enumerate([6, 29, 3])
+        ]
+        for user in users[:3]:
+            task = Task.objects.create(user=user, title='done', priority='low', is_completed=True)
+            Task.objects.filter(pk=task.pk).update(updated_at=local_time(2026, 10, 16, 23, 30))
+        # Karma from elsewhere on the same day lands on the same rollup rows
+        self.award(local_time(2026, 10, 17, 0, 30), 15, user=users[1])
+
+        with mock.patch('django.utils.timezone.now', return_value=local_time(2026, 10, 17, 0, 5)):
+            kept = calculate_user_streak_shard('2026-10-16', users[0].id, users[-1].id)
+
+        self.assertEqual(kept, 3)
+        self.assertEqual(KarmaTransaction.objects.filter(reason__contains='streak').count(), 5)
+        self.assertEqual(self.get_rollup(users[0]), {date(2026, 10, 17): 20})
+        self.assertEqual(self.get_rollup(users[1]), {date(2026, 10, 17): 20 + 350 + 15})
+        self.assertEqual(self.get_rollup(users[2]), {date(2026, 10, 17): 20 + 1000})
+        self.assertEqual(self.get_rollup(users[3]), {})
+        self.assertConsistent()
+
+    def test_check_reports_mismatches(self):
+        self.award(local_time(2026, 10, 16, 12), 50)
+        KarmaDaily.objects.filter(user=self.user).update(amount=49)
+
+        self.assertEqual(find_rollup_mismatches(), [(self.user.id, date(2026, 10, 16), 50, 49)])
+        with self.assertRaises(CommandError):
+            call_command('rebuild_karma_rollup', check=True, stdout=StringIO())
+
+        call_command('rebuild_karma_rollup', stdout=StringIO())
+        self.assertConsistent()
+
+
+class AwardKarmaTests(TestCase):
+
+    def setUp(self):
+        self.user = MyUser.objects.create(username='karma', email='karma@example.com', karma=5)
+
+    def test_badges_compare_with_the_stored_karma(self):
+        # The in-memory karma is stale and the penalty is clamped at 0
+        stale = MyUser.objects.get(pk=self.user.pk)
+        stale.karma = 100
+        with mock.patch('user.services.award_badges') as award_badges:
+            award_karma_to_user(stale, -20, 'penalty')
+
+        award_badges.assert_called_once_with(self.user.id, 0, old_karma=5)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.karma, 0)
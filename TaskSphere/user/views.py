@@ -19,9 +19,20 @@ from .serializers import (
 )
 from .tasks import send_otp_email, send_email
 from .services import generate_otp
+from .badges import get_badge_tier, get_badge_tiers, get_tier_progress
+from .leaderboard import (
+    LEADERBOARD_MAX_AROUND,
+    LEADERBOARD_MAX_LIMIT,
+    LEADERBOARD_WINDOWS,
+    get_leaderboard,
+    get_window_leaderboard,
+    remove_from_leaderboard,
+)
 from .throttling import OTPVerificationThrottle, OTPResendThrottle, ForgotPasswordThrottle
 
 from task.models import Task
+from task.cache_utils import get_not_modified_response, get_task_cache_state, make_etag, patch_conditional_headers
+from task.sparse_fields import get_only_columns, get_requested_fields
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -103,6 +114,7 @@ class UserRegistrationView(APIView):
                 if beginner_badge:
                     UserBadge.objects.create(user=user, badge=beginner_badge)
                 
+                # Saving an active user also puts them on the leaderboard
                 user.save()
 
                 # 2. Генерируем токены сразу
@@ -495,14 +507,32 @@ class UserProfileView(APIView):
     permission_classes = [IsAuthenticated]  # Add authentication requirement
     
     def get(self, request):
+        user = request.user
+
+        # Validators: task writes bump the generation, karma and streaks are
+        # on the user row we already loaded, and the 7 day chart moves daily
+        generation, last_modified = get_task_cache_state(user.id)
+        today_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        etag = make_etag(
+            'profile', user.id, generation, user.username, user.karma,
+            user.current_streak, user.highest_streak, today_start.date(),
+        )
+        last_modified = max(last_modified, int(today_start.timestamp()))
+
+        not_modified = get_not_modified_response(request, etag, last_modified)
+        if not_modified is not None:
+            return not_modified
+
         # Use user ID instead of username for cache key (more reliable)
         cache_key = f'profile_info_user_{request.user.id}'
         cache_data = cache.get(cache_key)
 
-        if cache_data:
-            return Response(cache_data, status=status.HTTP_200_OK)
+        # The body is only reused under the validators it was built for, so
+        # writes that do not delete this key can not pin a stale body
+        if cache_data and cache_data.get('etag') == etag:
+            response = Response(cache_data['data'], status=status.HTTP_200_OK)
+            return patch_conditional_headers(response, etag, last_modified)
 
-        user = request.user
         total_completed_tasks = Task.objects.filter(
             user=request.user,
             is_completed=True
@@ -554,10 +584,9 @@ class UserProfileView(APIView):
         ]
 
         # Get user's current badge level based on karma
-        current_badge_level = Badges.objects.filter(
-            karma_min__lte=user.karma,
-            karma_max__gte=user.karma
-        ).first()
+        current_badge_level = get_badge_tier(user.karma)
+        if current_badge_level:
+            progress = get_tier_progress(current_badge_level, user.karma)
         
         # Get all user badges (earned achievements)
         all_earned_badges = UserBadge.objects.filter(user=user).select_related('badge').order_by('-awarded_at')
@@ -573,8 +602,8 @@ class UserProfileView(APIView):
                 'name': current_badge_level.name if current_badge_level else 'No Badge',
                 'karma_min': current_badge_level.karma_min if current_badge_level else 0,
                 'karma_max': current_badge_level.karma_max if current_badge_level else 0,
-                'progress_percentage': round(((user.karma - current_badge_level.karma_min) / (current_badge_level.karma_max - current_badge_level.karma_min)) * 100, 2) if current_badge_level and current_badge_level.karma_max > current_badge_level.karma_min else 100,
-                'karma_to_next_level': max(0, current_badge_level.karma_max + 1 - user.karma) if current_badge_level else 0,
+                'progress_percentage': progress['percentage'],
+                'karma_to_next_level': progress['karma_to_next_level'],
             } if current_badge_level else None,
             'earned_badges': [
                 {
@@ -593,9 +622,10 @@ class UserProfileView(APIView):
 
         }
 
-        cache.set(cache_key, data, timeout=60*5)
+        cache.set(cache_key, {'etag': etag, 'data': data}, timeout=60*5)
 
-        return Response(data, status=status.HTTP_200_OK)
+        response = Response(data, status=status.HTTP_200_OK)
+        return patch_conditional_headers(response, etag, last_modified)
 
 
 class UserBadgesView(APIView):
@@ -627,15 +657,12 @@ class AllBadgesView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        all_badges = Badges.objects.all().order_by('karma_min')
-        user_badge_ids = UserBadge.objects.filter(user=request.user).values_list('badge_id', flat=True)
+        all_badges = get_badge_tiers()
+        user_badge_ids = set(UserBadge.objects.filter(user=request.user).values_list('badge_id', flat=True))
         
         # Find current badge level based on user's karma
         user_karma = request.user.karma
-        current_badge = Badges.objects.filter(
-            karma_min__lte=user_karma,
-            karma_max__gte=user_karma
-        ).first()
+        current_badge = get_badge_tier(user_karma)
         
         badges_data = [
             {
@@ -651,7 +678,7 @@ class AllBadgesView(APIView):
         ]
         
         return Response({
-            'total_available_badges': all_badges.count(),
+            'total_available_badges': len(all_badges),
             'badges': badges_data,
             'user_karma': user_karma,
             'current_badge': {
@@ -662,8 +689,7 @@ class AllBadgesView(APIView):
                     'current': user_karma,
                     'min': current_badge.karma_min,
                     'max': current_badge.karma_max,
-                    'percentage': round(((user_karma - current_badge.karma_min) / (current_badge.karma_max - current_badge.karma_min)) * 100, 2) if current_badge.karma_max > current_badge.karma_min else 100,
-                    'karma_to_next_level': max(0, current_badge.karma_max + 1 - user_karma)
+                    **get_tier_progress(current_badge, user_karma),
                 }
             } if current_badge else None,
         }, status=status.HTTP_200_OK)
@@ -675,40 +701,76 @@ class LeaderboardView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        limit = int(request.query_params.get('limit', 10))
-        
-        top_users = User.objects.filter(is_active=True).order_by('-karma')[:limit]
-        
-        leaderboard_data = []
-        for idx, user in enumerate(top_users, start=1):
-            # Get current badge level based on karma, not earned badges
-            current_badge_level = Badges.objects.filter(
-                karma_min__lte=user.karma,
-                karma_max__gte=user.karma
-            ).first()
-            
-            leaderboard_data.append({
-                'rank': idx,
-                'username': user.username,
-                'karma': user.karma,
-                'current_streak': user.current_streak,
-                'highest_streak': user.highest_streak,
-                'current_badge_level': current_badge_level.name if current_badge_level else 'No Badge',
-            })
-        
-        # Find current user's rank
-        current_user_rank = User.objects.filter(is_active=True, karma__gt=request.user.karma).count() + 1
-        
-        return Response({
-            'leaderboard': leaderboard_data,
+        limit = self.get_capped_param(request, 'limit', 10, 1, LEADERBOARD_MAX_LIMIT)
+        around = self.get_capped_param(request, 'around', 2, 0, LEADERBOARD_MAX_AROUND)
+        window = request.query_params.get('window')
+        if window is not None and window not in LEADERBOARD_WINDOWS:
+            return Response({
+                'error': f'window must be one of: {", ".join(LEADERBOARD_WINDOWS)}'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        # Positions and rank come from the Redis boards (user.leaderboard)
+        if window:
+            top, current_user_rank, nearby, window_karma = get_window_leaderboard(request.user, window, limit, around)
+        else:
+            top, current_user_rank, nearby = get_leaderboard(request.user, limit, around)
+        users = User.objects.only(
+            'id', 'username', 'karma', 'current_streak', 'highest_streak'
+        ).in_bulk({user_id for user_id, _, _ in top + nearby})
+
+        def entries(positions):
+            data = []
+            for user_id, idx, score in positions:
+                user = users.get(user_id)
+                if user is None:
+                    continue
+                # Get current badge level based on karma, not earned badges
+                current_badge_level = get_badge_tier(user.karma)
+
+                entry = {
+                    'rank': idx,
+                    'username': user.username,
+                    'karma': user.karma,
+                    'current_streak': user.current_streak,
+                    'highest_streak': user.highest_streak,
+                    'current_badge_level': current_badge_level.name if current_badge_level else 'No Badge',
+                }
+                if window:
+                    entry['window_karma'] = score
+                data.append(entry)
+            return data
+
+        data = {
+            'leaderboard': entries(top),
+            'around_you': entries(nearby),
             'your_rank': current_user_rank,
             'your_karma': request.user.karma,
-        }, status=status.HTTP_200_OK)
+        }
+        if window:
+            data['window'] = window
+            data['your_window_karma'] = window_karma
+        return Response(data, status=status.HTTP_200_OK)
+
+    def get_capped_param(self, request, name, default, minimum, maximum):
+        try:
+            value = int(request.query_params.get(name, default))
+        except ValueError:
+            value = default
+        return min(max(value, minimum), maximum)
 
 
 class KarmaHistoryView(APIView):
     """View karma transaction history for the current user"""
     permission_classes = [IsAuthenticated]
+
+    # Transaction fields and the columns they read (?fields= / ?omit=)
+    transaction_field_columns = {
+        'id': ('id',),
+        'amount': ('amount',),
+        'reason': ('reason',),
+        'created_at': ('created_at',),
+        'type': ('amount',),
+    }
     
     def get(self, request):
         from .models import KarmaTransaction
@@ -719,9 +781,14 @@ class KarmaHistoryView(APIView):
         days = int(request.query_params.get('days', 30))  # Last 30 days by default
         limit = int(request.query_params.get('limit', 50))  # Max 50 transactions
         
+        # Only load the columns of the requested transaction fields
+        transaction_fields = get_requested_fields(request, self.transaction_field_columns) or tuple(self.transaction_field_columns)
+
         # Get transactions
         transactions = KarmaTransaction.objects.filter(
             user=request.user
+        ).only(
+            *get_only_columns(transaction_fields, self.transaction_field_columns)
         ).order_by('-created_at')[:limit]
         
         # Calculate statistics
@@ -736,16 +803,15 @@ class KarmaHistoryView(APIView):
         total_earned = recent_transactions.filter(amount__gt=0).aggregate(Sum('amount'))['amount__sum'] or 0
         total_lost = abs(recent_transactions.filter(amount__lt=0).aggregate(Sum('amount'))['amount__sum'] or 0)
         
-        transactions_data = [
-            {
-                'id': t.id,
-                'amount': t.amount,
-                'reason': t.reason,
-                'created_at': t.created_at,
-                'type': 'earned' if t.amount > 0 else 'lost'
-            }
-            for t in transactions
-        ]
+        transactions_data = []
+        for t in transactions:
+            transaction_data = {}
+            for name in transaction_fields:
+                if name == 'type':
+                    transaction_data['type'] = 'earned' if t.amount > 0 else 'lost'
+                else:
+                    transaction_data[name] = getattr(t, name)
+            transactions_data.append(transaction_data)
         
         return Response({
             'current_karma': request.user.karma,
@@ -954,10 +1020,12 @@ class DeleteAccountView(APIView):
         
         # Delete user (this will cascade delete all related data)
         username = user.username
+        user_id = user.id
         user.delete()
+        remove_from_leaderboard(user_id)
         
         # Invalidate caches
-        cache_key = f'profile_info_user_{user.id}'
+        cache_key = f'profile_info_user_{user_id}'
         cache.delete(cache_key)
         
         return Response({